@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class AttendenceappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'attendenceapp'
\ No newline at end of file
+    name = 'attendenceapp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,85 @@
+"""In-memory record of today's check-ins, used to short-circuit duplicate check-ins.
+
+The record is filled from the check-ins AttendanceLog.create_checkin(s)
+commits or finds already there, and is emptied at local midnight
+(``TIME_ZONE``) and every ``CHECKIN_CACHE_TTL`` seconds, so check-ins
+deleted by another process (an admin, another worker) stop answering
+"already marked". It is process-local: an employee missing from it may have
+been checked in by another worker. Callers about to check the employee in
+treat a miss as "try the insert", whose ``ON CONFLICT DO NOTHING`` decides
+and returns the existing check-in; only callers that will not insert ask for
+the DB fallback (``check_db=True``).
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import AttendanceLog
+
+
+def local_day_bounds(day):
+    """Aware [start, end) datetimes of a local calendar day, usable as an index range instead of __date."""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()), tz)
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), datetime.min.time()), tz)
+    return start, end
+
+
+class TodaysCheckins:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = None
+        self._started_at = 0.0
+        self._logs = {}  # user id -> AttendanceLog (only checkin_time/status are relied upon)
+
+    def _current(self):
+        """Today's mapping, emptied after local midnight or CHECKIN_CACHE_TTL. Caller holds the lock."""
+        today = timezone.localdate()
+        if self._day != today or time.monotonic() - self._started_at > settings.CHECKIN_CACHE_TTL:
+            self._day = today
+            self._started_at = time.monotonic()
+            self._logs = {}
+        return self._logs
+
+    def get(self, user_id, check_db=False):
+        """Today's check-in log of user_id, or None."""
+        return self.get_many([user_id], check_db).get(user_id)
+
+    def get_many(self, user_ids, check_db=False):
+        """{user_id: log} for those of user_ids known to have checked in today; check_db=True also asks the DB."""
+        with self._lock:
+            logs = self._current()
+            day = self._day
+            found = {user_id: logs[user_id] for user_id in user_ids if user_id in logs}
+        missing = [user_id for user_id in user_ids if user_id not in found]
+        if not missing or not check_db:
+            return found
+
+        # Another worker may have checked them in
+        start, end = local_day_bounds(day)
+        for log in AttendanceLog.objects.filter(
+            employee_id__in=missing, checkin_time__gte=start, checkin_time__lt=end
+        ).order_by('checkin_time'):
+            found.setdefault(log.employee_id, log)
+        for user_id in missing:
+            if user_id in found:
+                self.add(found[user_id])
+        return found
+
+    def add(self, log):
+        """Record a committed check-in."""
+        with self._lock:
+            logs = self._current()
+            if timezone.localtime(log.checkin_time).date() == self._day:
+                logs.setdefault(log.employee_id, log)
+
+    def discard(self, log):
+        with self._lock:
+            if self._logs.get(log.employee_id) is not None and self._logs[log.employee_id].pk == log.pk:
+                del self._logs[log.employee_id]
+
+
+todays_checkins = TodaysCheckins()
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:35
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_checkin_date(apps, schema_editor):
+    """Set checkin_date on the first check-in of each employee and day; later duplicates keep NULL."""
+    AttendanceLog = apps.get_model('attendenceapp', 'AttendanceLog')
+    seen = set()
+    batch = []
+    logs = AttendanceLog.objects.using(schema_editor.connection.alias).order_by('checkin_time', 'pk')
+    for log in logs.only('pk', 'employee_id', 'checkin_time').iterator(chunk_size=2000):
+        key = (log.employee_id, timezone.localtime(log.checkin_time).date())
+        if key in seen:
+            continue
+        seen.add(key)
+        log.checkin_date = key[1]
+        batch.append(log)
+        if len(batch) >= 2000:
+            AttendanceLog.objects.using(schema_editor.connection.alias).bulk_update(batch, ['checkin_date'])
+            batch = []
+    AttendanceLog.objects.using(schema_editor.connection.alias).bulk_update(batch, ['checkin_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendenceapp', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancelog',
+            name='checkin_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_checkin_date, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='attendancelog',
+            constraint=models.UniqueConstraint(fields=('employee', 'checkin_date'), name='unique_daily_checkin'),
+        ),
+    ]
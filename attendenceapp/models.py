@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import IntegrityError, connections, models, router, transaction
 from django.conf import settings
 from django.utils import timezone
 
@@ -32,18 +32,29 @@ class AttendanceLog(models.Model):
 
     employee = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     checkin_time = models.DateTimeField(default=timezone.now)
+    # Local (TIME_ZONE) date of checkin_time, backing the one-check-in-per-day constraint.
+    # Null only on duplicate check-ins recorded before the constraint existed.
+    checkin_date = models.DateField(null=True, blank=True, editable=False)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['employee', 'checkin_date'], name='unique_daily_checkin'),
+        ]
+
     def __str__(self):
         return f"{self.employee} - {self.checkin_time} - {self.status}"
 
-    @classmethod
-    def create_checkin(cls, employee, checkin_time=None):
-        """Create an attendance log and determine late vs present using AttendanceSettings."""
-        if checkin_time is None:
-            checkin_time = timezone.now()
+    def save(self, *args, **kwargs):
+        if self._state.adding or self.checkin_date is not None:
+            self.checkin_date = timezone.localtime(self.checkin_time).date()
+        super().save(*args, **kwargs)
 
-        settings_obj = AttendanceSettings.get_solo()
+    @classmethod
+    def status_for(cls, checkin_time, settings_obj=None):
+        """Determine late vs present for checkin_time using AttendanceSettings."""
+        if settings_obj is None:
+            settings_obj = AttendanceSettings.get_solo()
 
         # Convert checkin_time to local timezone for date extraction
         local_checkin = timezone.localtime(checkin_time)
@@ -59,8 +70,108 @@ class AttendanceLog(models.Model):
         late_threshold = start_dt + buffer_delta
 
         if checkin_time > late_threshold:
-            status = cls.STATUS_LATE
+            return cls.STATUS_LATE
+        return cls.STATUS_PRESENT
+
+    @classmethod
+    def create_checkin(cls, employee, checkin_time=None, settings_obj=None):
+        """Check employee in, or return the check-in they already have that day.
+
+        Returns ``(log, created)``; late vs present is determined using AttendanceSettings.
+        """
+        return cls.create_checkins([employee], checkin_time, settings_obj)[0]
+
+    @classmethod
+    def create_checkins(cls, employees, checkin_time=None, settings_obj=None):
+        """Bulk variant of create_checkin for several employees checking in at the same moment.
+
+        Returns one ``(log, created)`` per employee, in order. A single
+        ``INSERT ... ON CONFLICT DO NOTHING RETURNING`` statement does the work;
+        only employees that were already checked in cost a second query.
+        """
+        if checkin_time is None:
+            checkin_time = timezone.now()
+
+        status = cls.status_for(checkin_time, settings_obj)
+        checkin_date = timezone.localtime(checkin_time).date()
+        using = router.db_for_write(cls)
+        connection = connections[using]
+        if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_rows_from_bulk_insert:
+            created = cls._insert_new(employees, checkin_time, checkin_date, status, using)
         else:
-            status = cls.STATUS_PRESENT
+            created = cls._insert_new_fallback(employees, checkin_time, checkin_date, status, using)
+
+        existing = {}
+        missing = [employee.pk for employee in employees if employee.pk not in created]
+        if missing:
+            existing = {
+                log.employee_id: log
+                for log in cls.objects.using(using).filter(employee_id__in=missing, checkin_date=checkin_date)
+            }
+
+        results = [
+            (created[employee.pk], True) if employee.pk in created else (existing[employee.pk], False)
+            for employee in employees
+        ]
+        cls._record_checkins([log for log, _ in results])
+        return results
+
+    @classmethod
+    def _insert_new(cls, employees, checkin_time, checkin_date, status, using):
+        """Insert the check-ins that do not conflict; returns {employee_id: log} of the rows inserted."""
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        fields = [cls._meta.get_field(name) for name in ('employee', 'checkin_time', 'checkin_date', 'status')]
+        values = [
+            fields[1].get_db_prep_save(checkin_time, connection),
+            fields[2].get_db_prep_save(checkin_date, connection),
+            status,
+        ]
+        employee_ids = list(dict.fromkeys(employee.pk for employee in employees))
+        sql = 'INSERT INTO {table} ({columns}) VALUES {rows} ON CONFLICT ({employee}, {date}) DO NOTHING RETURNING {pk}, {employee}'.format(
+            table=qn(cls._meta.db_table),
+            columns=', '.join(qn(field.column) for field in fields),
+            rows=', '.join(['(%s, %s, %s, %s)'] * len(employee_ids)),
+            employee=qn(fields[0].column),
+            date=qn(fields[2].column),
+            pk=qn(cls._meta.pk.column),
+        )
+        params = [param for employee_id in employee_ids for param in [employee_id, *values]]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        employees_by_id = {employee.pk: employee for employee in employees}
+        created = {}
+        for pk, employee_id in rows:
+            log = cls(pk=pk, employee=employees_by_id[employee_id], checkin_time=checkin_time, checkin_date=checkin_date, status=status)
+            log._state.adding = False
+            log._state.db = using
+            created[employee_id] = log
+        return created
 
-        return cls.objects.create(employee=employee, checkin_time=checkin_time, status=status)
+    @classmethod
+    def _insert_new_fallback(cls, employees, checkin_time, checkin_date, status, using):
+        """_insert_new for backends without ON CONFLICT ... RETURNING: one savepointed insert per employee."""
+        created = {}
+        for employee in employees:
+            if employee.pk in created:
+                continue
+            try:
+                with transaction.atomic(using=using):
+                    created[employee.pk] = cls.objects.using(using).create(
+                        employee=employee, checkin_time=checkin_time, checkin_date=checkin_date, status=status,
+                    )
+            except IntegrityError:
+                pass
+        return created
+
+    @staticmethod
+    def _record_checkins(logs):
+        """Add committed check-ins to the in-memory record used for duplicate checks."""
+        from .checkins import todays_checkins
+
+        def record():
+            for log in logs:
+                todays_checkins.add(log)
+        transaction.on_commit(record)
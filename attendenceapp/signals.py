@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import AttendanceLog
+from .checkins import todays_checkins
+
+
+@receiver(post_delete, sender=AttendanceLog)
+def attendance_log_deleted(sender, instance, **kwargs):
+    """Let a deleted check-in be made again today."""
+    todays_checkins.discard(instance)
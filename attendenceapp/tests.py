@@ -0,0 +1,108 @@
+from datetime import time, timedelta
+from unittest import mock
+
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from attendenceapp.checkins import TodaysCheckins
+from attendenceapp.models import AttendanceLog, AttendanceSettings
+from user.models import User
+
+
+def make_user(name):
+    user = User(username=name, email=f'{name}@example.com', first_name=name, role=User.EMPLOYEE)
+    user.save(force_insert=True)
+    return user
+
+
+class CreateCheckinsTests(TestCase):
+    def setUp(self):
+        AttendanceSettings.objects.create(pk=1, start_time=time(9), end_time=time(18))
+        self.ann, self.bob, self.cid = make_user('ann'), make_user('bob'), make_user('cid')
+        self.now = timezone.now()
+
+    def test_inserts_new_and_returns_existing_checkins(self):
+        first = AttendanceLog.create_checkins([self.ann, self.bob], self.now)
+        self.assertEqual([created for _, created in first], [True, True])
+        self.assertEqual([log.employee_id for log, _ in first], [self.ann.pk, self.bob.pk])
+        self.assertTrue(all(log.pk for log, _ in first))
+
+        later = self.now + timedelta(seconds=5)
+        second = AttendanceLog.create_checkins([self.ann, self.cid], later)
+        self.assertEqual([created for _, created in second], [False, True])
+        # The conflicting employee gets the row that was already there, not a new one
+        self.assertEqual(second[0][0].pk, first[0][0].pk)
+        self.assertEqual(second[0][0].checkin_time, self.now)
+        self.assertEqual(AttendanceLog.objects.count(), 3)
+
+    def test_next_day_is_a_new_checkin(self):
+        AttendanceLog.create_checkin(self.ann, self.now)
+        log, created = AttendanceLog.create_checkin(self.ann, self.now + timedelta(days=1))
+        self.assertTrue(created)
+        self.assertEqual(log.checkin_date, timezone.localtime(self.now + timedelta(days=1)).date())
+        self.assertEqual(AttendanceLog.objects.filter(employee=self.ann).count(), 2)
+
+    def test_fallback_without_returning_behaves_the_same(self):
+        # As on a backend without INSERT ... ON CONFLICT ... RETURNING
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            first = AttendanceLog.create_checkins([self.ann, self.bob], self.now)
+            second = AttendanceLog.create_checkins([self.ann, self.cid], self.now)
+        self.assertEqual([created for _, created in first], [True, True])
+        self.assertEqual([created for _, created in second], [False, True])
+        self.assertEqual(second[0][0].pk, first[0][0].pk)
+        self.assertEqual(AttendanceLog.objects.count(), 3)
+
+    def test_database_rejects_a_second_checkin_on_the_same_day(self):
+        AttendanceLog.create_checkin(self.ann, self.now)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            AttendanceLog.objects.create(employee=self.ann, checkin_time=self.now, status=AttendanceLog.STATUS_PRESENT)
+
+
+@override_settings(CHECKIN_CACHE_TTL=60)
+class TodaysCheckinsTests(TestCase):
+    def setUp(self):
+        AttendanceSettings.objects.create(pk=1, start_time=time(9), end_time=time(18))
+        self.ann = make_user('ann')
+        self.checkins = TodaysCheckins()
+        self.today = timezone.localdate()
+        self.log, _ = AttendanceLog.create_checkin(self.ann)
+
+    def remember(self):
+        with mock.patch('attendenceapp.checkins.time.monotonic', return_value=100.0):
+            self.checkins.add(self.log)
+
+    def get(self, day=None, now=100.0, check_db=False):
+        with mock.patch('attendenceapp.checkins.timezone.localdate', return_value=day or self.today), \
+                mock.patch('attendenceapp.checkins.time.monotonic', return_value=now):
+            return self.checkins.get(self.ann.pk, check_db)
+
+    def test_remembered_checkin_is_served_from_memory(self):
+        self.remember()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(now=159.0), self.log)
+
+    def test_miss_does_not_query_unless_asked(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.get())
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get(check_db=True).pk, self.log.pk)
+        # The DB answer is remembered
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().pk, self.log.pk)
+
+    def test_forgets_checkins_after_the_ttl(self):
+        self.remember()
+        # The check-in may have been deleted by another process since; nothing is reloaded from the DB
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.get(now=161.0))
+
+    def test_rolls_over_at_midnight(self):
+        self.remember()
+        tomorrow = self.today + timedelta(days=1)
+        self.assertIsNone(self.get(day=tomorrow))
+        # Yesterday's check-in is not recorded into the new day
+        with mock.patch('attendenceapp.checkins.timezone.localdate', return_value=tomorrow), \
+                mock.patch('attendenceapp.checkins.time.monotonic', return_value=100.0):
+            self.checkins.add(self.log)
+        self.assertIsNone(self.get(day=tomorrow))
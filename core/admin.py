@@ -1,10 +1,23 @@
 from django.contrib import admin
-from .models import Employee, Attendance,Feature,SiteSettings,Step
+from .models import Employee, Attendance,Feature,SiteSettings,Step,EnrollmentJob,FaceTemplate,Location,Device,AttendanceCompat
+
+
+class FaceTemplateInline(admin.TabularInline):
+    model = FaceTemplate
+    fields = ('image', 'created_at')
+    readonly_fields = ('image', 'created_at')
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        # Templates are added through the face upload API so their encoding gets computed
+        return False
+
 
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
-    list_display = ('get_name', 'user', 'image')
-    list_filter = ('user__role',)
+    list_display = ('get_name', 'user', 'location', 'image')
+    list_filter = ('user__role', 'location')
+    inlines = [FaceTemplateInline]
     
     def get_name(self, obj):
         return obj.name
@@ -18,6 +31,36 @@ class EmployeeAdmin(admin.ModelAdmin):
 
 admin.site.register(Attendance)
 
+
+@admin.register(AttendanceCompat)
+class AttendanceCompatAdmin(admin.ModelAdmin):
+    """Legacy-shaped view of AttendanceLog; read-only."""
+    list_display = ('employee', 'timestamp', 'attendance_log')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(EnrollmentJob)
+
+
+@admin.register(Location)
+class LocationAdmin(admin.ModelAdmin):
+    list_display = ('name', 'fallback_to_global', 'created_at')
+
+
+@admin.register(Device)
+class DeviceAdmin(admin.ModelAdmin):
+    list_display = ('device_id', 'name', 'location', 'is_active')
+    list_filter = ('location', 'is_active')
+
+
 admin.site.register(Feature)
 admin.site.register(SiteSettings)
 admin.site.register(Step)
\ No newline at end of file
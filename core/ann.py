@@ -0,0 +1,179 @@
+"""Inverted-file (IVF) approximate nearest-neighbour index for the face gallery.
+
+Encodings are partitioned with k-means; a probe only scans the ``n_probe``
+partitions whose centroids are closest to it, and the candidates found are
+re-ranked with exact euclidean distances, so the distance compared against
+the match threshold is always the exact one.
+
+k-means is only trained by ``manage.py build_face_index``, which persists the
+index to ``settings.FACE_ANN_INDEX_PATH`` (atomically, so concurrent readers
+never see a partial file). Web workers only load it on each gallery rebuild:
+unchanged rows keep their partition and new or changed rows are assigned to
+the nearest existing centroid. Once the gallery has drifted too far from what
+the index was trained on, workers fall back to exact scans until the command
+is run again.
+"""
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+# Retrain once this fraction of rows is new/changed, or the gallery grew by this factor
+RETRAIN_CHANGED_FRACTION = 0.3
+RETRAIN_GROWTH_FACTOR = 2.0
+
+TRAIN_ITERATIONS = 10
+TRAIN_POINTS_PER_LIST = 256
+ASSIGN_CHUNK_SIZE = 4096
+
+
+def _squared_distances(vectors, centroids):
+    """Pairwise squared euclidean distances, shape (len(vectors), len(centroids))."""
+    return (
+        np.einsum('ij,ij->i', vectors, vectors)[:, None]
+        - 2.0 * vectors @ centroids.T
+        + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+    )
+
+
+def assign_to_centroids(vectors, centroids):
+    """Index of the nearest centroid for every vector, computed in bounded-size chunks."""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_SIZE):
+        chunk = vectors[start:start + ASSIGN_CHUNK_SIZE]
+        assignments[start:start + len(chunk)] = np.argmin(_squared_distances(chunk, centroids), axis=1)
+    return assignments
+
+
+def train_centroids(vectors, n_lists, iterations=TRAIN_ITERATIONS, seed=0):
+    """Plain Lloyd k-means on a random sample of ``vectors``."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * TRAIN_POINTS_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = assign_to_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=n_lists)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty partitions so every list stays usable
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+    return centroids
+
+
+def default_n_lists(size):
+    return max(1, int(np.sqrt(size)))
+
+
+class IVFIndex:
+    """Partition of gallery rows into k-means lists; row numbers refer to the gallery matrix."""
+
+    def __init__(self, centroids, assignments, trained_size):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32)
+        self.trained_size = int(trained_size)
+
+        # Inverted lists as one sorted row array plus per-list offsets
+        self.rows = np.argsort(self.assignments, kind='stable').astype(np.int64)
+        counts = np.bincount(self.assignments, minlength=len(self.centroids))
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def candidates(self, probe, n_probe):
+        """Gallery rows stored in the ``n_probe`` partitions closest to ``probe``."""
+        n_probe = min(n_probe, len(self.centroids))
+        centroid_distances = _squared_distances(probe[None, :], self.centroids)[0]
+        nearest = np.argpartition(centroid_distances, n_probe - 1)[:n_probe]
+        return np.concatenate([self.rows[self.offsets[i]:self.offsets[i + 1]] for i in nearest])
+
+    @classmethod
+    def build(cls, encodings, employee_ids, path=None, train=True):
+        """Build an index for the gallery, reusing the persisted one at ``path`` where possible.
+
+        With ``train=False`` nothing is trained or written: returns None when
+        there is no persisted index usable for this gallery.
+        """
+        previous = cls._load(path) if path else None
+        index = cls._update(previous, encodings, employee_ids) if previous else None
+        if not train:
+            return index
+        if index is None:
+            centroids = train_centroids(encodings, default_n_lists(len(encodings)))
+            index = cls(centroids, assign_to_centroids(encodings, centroids), len(encodings))
+        if path:
+            index._save(path, encodings, employee_ids)
+        return index
+
+    @classmethod
+    def _update(cls, previous, encodings, employee_ids):
+        """Incrementally re-use ``previous`` for the new gallery, or return None if it should be retrained."""
+        if len(encodings) > previous['trained_size'] * RETRAIN_GROWTH_FACTOR:
+            return None
+
+        # An employee may own several rows (face templates)
+        old_rows = {}
+        for row, employee_id in enumerate(previous['employee_ids']):
+            old_rows.setdefault(int(employee_id), []).append(row)
+        assignments = np.full(len(encodings), -1, dtype=np.int32)
+        for row, employee_id in enumerate(employee_ids):
+            for old_row in old_rows.get(int(employee_id), ()):
+                if np.array_equal(previous['encodings'][old_row], encodings[row]):
+                    assignments[row] = previous['assignments'][old_row]
+                    break
+
+        changed = np.flatnonzero(assignments < 0)
+        if len(changed) > RETRAIN_CHANGED_FRACTION * len(encodings):
+            return None
+        if len(changed):
+            assignments[changed] = assign_to_centroids(encodings[changed], previous['centroids'])
+        return cls(previous['centroids'], assignments, previous['trained_size'])
+
+    @staticmethod
+    def _load(path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if int(data['version']) != INDEX_VERSION:
+                    return None
+                return {
+                    'centroids': data['centroids'],
+                    'assignments': data['assignments'],
+                    'employee_ids': data['employee_ids'],
+                    'encodings': data['encodings'],
+                    'trained_size': int(data['trained_size']),
+                }
+        except Exception:
+            logger.warning('Ignoring unreadable face index at %s', path, exc_info=True)
+            return None
+
+    def _save(self, path, encodings, employee_ids):
+        """Write the index atomically so concurrent readers never see a partial file."""
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(
+                    f,
+                    version=INDEX_VERSION,
+                    centroids=self.centroids,
+                    assignments=self.assignments,
+                    employee_ids=np.asarray(employee_ids, dtype=np.int64),
+                    encodings=encodings,
+                    trained_size=self.trained_size,
+                )
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            logger.warning('Could not persist face index to %s', path, exc_info=True)
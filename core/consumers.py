@@ -0,0 +1,136 @@
+"""Streaming face recognition for kiosks over a WebSocket (``ws/attendance/``).
+
+A kiosk opens one socket and sends camera frames as binary messages (JPEG or
+PNG bytes). Only the most recent frame is kept: a frame that arrives while
+the previous one is still being recognised replaces it, and a frame that
+waited longer than ``WS_FRAME_MAX_AGE`` seconds is dropped. Each recognised
+frame gets one JSON text message back, with the same ``status``/``message``/
+``data`` fields as ``/core/api/mark-attendance/`` plus::
+
+    {"type": "result", "frame": <sequence number>, "dropped": <frames skipped since the last result>, "httpStatus": 200, ...}
+
+Query string options: ``device`` (or an ``X-Device-Id`` header) selects the
+device's location gallery and frame dedup, ``group=true`` checks in every
+face of a frame. A text message ``{"group": true|false}`` changes the mode on
+an open socket.
+
+Results of a device are delivered through the channel layer group of that
+device, so every socket opened with the same device id (for example the
+camera and a separate display) receives them.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from time import monotonic
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.db import close_old_connections
+
+from .metrics import StageTimer
+
+logger = logging.getLogger(__name__)
+
+TRUE_VALUES = ('true', 'True', '1')
+
+
+def recognize_frame(img_bytes, group, device_id):
+    """Run one frame through the HTTP view's pipeline; returns ``(data, http_status)``."""
+    from .views import FaceRecognitionAttendanceView
+
+    close_old_connections()
+    try:
+        timer = StageTimer('websocket_attendance')
+        response = FaceRecognitionAttendanceView().recognize_device_frame(img_bytes, group, device_id, timer)
+        timer.finish(response)
+        return response.data, response.status_code
+    except Exception as e:
+        logger.exception('WebSocket recognition failed')
+        return {'status': 'error', 'message': f'Server error: {str(e)}'}, 500
+    finally:
+        close_old_connections()
+
+
+class KioskConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        headers = dict(self.scope.get('headers', []))
+        self.device_id = (headers.get(b'x-device-id', b'').decode() or params.get('device', [''])[0]) or None
+        self.group = params.get('group', [''])[0] in TRUE_VALUES
+
+        self.received = 0
+        self.dropped = 0
+        self.latest = None  # (sequence number, monotonic arrival time, bytes) of the newest unprocessed frame
+        self.frame_ready = asyncio.Event()
+
+        # Group names only allow a restricted charset, so use a digest of the device id
+        self.device_group = None
+        if self.device_id and self.channel_layer is not None:
+            self.device_group = 'kiosk.' + hashlib.sha1(self.device_id.encode()).hexdigest()
+            await self.channel_layer.group_add(self.device_group, self.channel_name)
+
+        await self.accept()
+        self.worker = asyncio.ensure_future(self.process_frames())
+
+    async def disconnect(self, code):
+        worker = getattr(self, 'worker', None)
+        if worker is not None:
+            worker.cancel()
+        if getattr(self, 'device_group', None):
+            await self.channel_layer.group_discard(self.device_group, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            if len(bytes_data) > settings.WS_FRAME_MAX_BYTES:
+                await self.send_json({'type': 'error', 'message': f'Frame larger than {settings.WS_FRAME_MAX_BYTES} bytes'})
+                return
+            self.received += 1
+            if self.latest is not None:
+                # Recognition is still busy with an older frame; the one waiting is superseded
+                self.dropped += 1
+            self.latest = (self.received, monotonic(), bytes_data)
+            self.frame_ready.set()
+            return
+
+        try:
+            options = json.loads(text_data)
+            if not isinstance(options, dict):
+                raise ValueError
+        except ValueError:
+            await self.send_json({'type': 'error', 'message': 'Text messages must be a JSON object of options'})
+            return
+        if 'group' in options:
+            self.group = options['group'] in (True, *TRUE_VALUES, 1)
+
+    async def process_frames(self):
+        """Recognise the newest frame, one at a time, for as long as the socket is open."""
+        while True:
+            await self.frame_ready.wait()
+            self.frame_ready.clear()
+            frame, self.latest = self.latest, None
+            if frame is None:
+                continue
+            sequence, arrived, img_bytes = frame
+            if monotonic() - arrived > settings.WS_FRAME_MAX_AGE:
+                self.dropped += 1
+                continue
+
+            # Off the event loop, in parallel with other sockets' frames
+            data, http_status = await sync_to_async(recognize_frame, thread_sensitive=False)(
+                img_bytes, self.group, self.device_id
+            )
+            dropped, self.dropped = self.dropped, 0
+            result = {'type': 'result', 'frame': sequence, 'dropped': dropped, 'httpStatus': http_status, **data}
+            if self.device_group:
+                await self.channel_layer.group_send(self.device_group, {'type': 'checkin.result', 'result': result})
+            else:
+                await self.send_json(result)
+
+    async def checkin_result(self, event):
+        await self.send_json(event['result'])
+
+    async def send_json(self, content):
+        await self.send(text_data=json.dumps(content))
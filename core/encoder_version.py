@@ -0,0 +1,21 @@
+"""Version of the face encoder, readable without loading it.
+
+Part of the encoding cache key (see core.encoding_cache): cached encodings are
+only reused for the same models. It comes from the installed package metadata,
+so web workers never import dlib or OpenCV just to build a cache key.
+"""
+from importlib import metadata
+
+
+def _installed_version(module):
+    """Version of the distribution that installs ``module`` (e.g. dlib-bin for dlib), or 'unknown'.
+
+    Matched on the installed files, since some wheels' top_level.txt does not name the package.
+    """
+    for dist in metadata.distributions():
+        if any(path.parts[0] == module for path in dist.files or []):
+            return dist.version
+    return 'unknown'
+
+
+ENCODER_VERSION = f'face_recognition {_installed_version("face_recognition")}; dlib {_installed_version("dlib")}'
@@ -0,0 +1,67 @@
+"""Content-addressed cache of face encodings.
+
+Entries are keyed by the SHA-256 of the image bytes plus
+``core.encoder_version.ENCODER_VERSION``, so re-uploading an identical photo costs
+a hash and one indexed lookup instead of a full dlib pass. The table is
+bounded to ``ENCODING_CACHE_MAX_ENTRIES`` rows, evicting the least recently
+used entries.
+"""
+import hashlib
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .encoder_version import ENCODER_VERSION
+from .gallery import ENCODING_SIZE
+from .models import EncodingCacheEntry
+
+
+def content_hash(img_bytes):
+    return hashlib.sha256(img_bytes).hexdigest()
+
+
+def lookup(img_bytes):
+    """Cached encodings for these image bytes, or None on a miss."""
+    if not settings.ENCODING_CACHE_MAX_ENTRIES:
+        return None
+    entry = EncodingCacheEntry.objects.filter(
+        content_hash=content_hash(img_bytes), encoder_version=ENCODER_VERSION
+    ).first()
+    if entry is None:
+        return None
+    EncodingCacheEntry.objects.filter(pk=entry.pk).update(last_used_at=timezone.now())
+    return entry.get_encodings()
+
+
+def store(img_bytes, encodings):
+    """Remember the encodings (possibly an empty list) computed for these image bytes."""
+    max_entries = settings.ENCODING_CACHE_MAX_ENTRIES
+    if not max_entries:
+        return
+    matrix = np.asarray(encodings, dtype=np.float32).reshape(len(encodings), ENCODING_SIZE)
+    # A concurrent request may have stored the same image already
+    EncodingCacheEntry.objects.bulk_create([
+        EncodingCacheEntry(
+            content_hash=content_hash(img_bytes),
+            encoder_version=ENCODER_VERSION,
+            encodings=matrix.tobytes(),
+            face_count=len(encodings),
+        )
+    ], ignore_conflicts=True)
+
+    overflow = EncodingCacheEntry.objects.count() - max_entries
+    if overflow > 0:
+        oldest = list(EncodingCacheEntry.objects.order_by('last_used_at').values_list('pk', flat=True)[:overflow])
+        EncodingCacheEntry.objects.filter(pk__in=oldest).delete()
+
+
+def get_or_compute(img_bytes, compute):
+    """Return ``compute(img_bytes)`` (a list of encodings, or None if undecodable), using the cache."""
+    encodings = lookup(img_bytes)
+    if encodings is not None:
+        return encodings
+    encodings = compute(img_bytes)
+    if encodings is not None:
+        store(img_bytes, encodings)
+    return encodings
@@ -0,0 +1,74 @@
+"""Background processing of EnrollmentJob rows (see ``run_enrollment_worker``)."""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import EnrollmentJob, FaceTemplate
+
+logger = logging.getLogger(__name__)
+
+
+def claim_next_job():
+    """Mark the oldest pending (or stale running) job as running and return it, or None."""
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.ENROLLMENT_JOB_TIMEOUT)
+    with transaction.atomic():
+        job = (
+            EnrollmentJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=EnrollmentJob.STATUS_PENDING)
+                | Q(status=EnrollmentJob.STATUS_RUNNING, started_at__lt=stale_before)
+            )
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = EnrollmentJob.STATUS_RUNNING
+        job.started_at = now
+        job.save(update_fields=['status', 'started_at'])
+    return job
+
+
+def _finish(job, status, message):
+    job.status = status
+    job.message = message
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'message', 'finished_at'])
+
+
+def process_job(job):
+    """Compute the encoding for job.image and store it on the employee."""
+    from .encoding_cache import get_or_compute
+    from .recognition import encode_image
+
+    try:
+        with job.image.open('rb') as f:
+            img_bytes = f.read()
+        encodings = get_or_compute(img_bytes, encode_image)
+    except Exception as e:
+        logger.exception('Enrollment job %s failed', job.pk)
+        _finish(job, EnrollmentJob.STATUS_FAILED, f'Image processing error: {str(e)}')
+        return job
+
+    if encodings is None:
+        _finish(job, EnrollmentJob.STATUS_FAILED, 'Unable to decode image')
+    elif not encodings:
+        _finish(job, EnrollmentJob.STATUS_FAILED, 'Recapture your image. No face detected in the image.')
+    elif job.add_template:
+        with transaction.atomic():
+            FaceTemplate.add(job.employee, encodings[0], image=job.image.name)
+            _finish(job, EnrollmentJob.STATUS_DONE, 'Face template added.')
+    else:
+        employee = job.employee
+        with transaction.atomic():
+            employee.image = job.image.name
+            employee.set_encoding(encodings[0])
+            # Commit triggers the gallery refresh (core.signals)
+            employee.save(compute_encoding=False)
+            _finish(job, EnrollmentJob.STATUS_DONE, 'Face encoding stored successfully.')
+    return job
@@ -0,0 +1,112 @@
+"""Process pool that runs face detection/encoding off the request thread.
+
+Each pool process loads the dlib detector and encoder once at startup, so
+recognition throughput scales with ``RECOGNITION_POOL_WORKERS`` rather than
+with the number of web workers. Submissions are bounded by
+``RECOGNITION_QUEUE_DEPTH`` (excess requests fail fast with
+``RecognitionBusy``) and each task waits at most
+``RECOGNITION_TASK_TIMEOUT`` seconds (``RecognitionTimeout``).
+
+With ``RECOGNITION_POOL_WORKERS = 0`` tasks run inline in the caller.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RecognitionUnavailable(Exception):
+    """Recognition could not be run right now; the client should retry."""
+
+
+class RecognitionBusy(RecognitionUnavailable):
+    pass
+
+
+class RecognitionTimeout(RecognitionUnavailable):
+    pass
+
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+def init_worker():
+    """Pool process initializer: configure Django and load the dlib models once."""
+    import django
+    django.setup()
+
+    from .recognition import warm_up_models
+
+    # One dummy inference so the first real task does not pay for lazy setup
+    warm_up_models()
+
+
+def call_recognition(name, *args):
+    """Run ``core.recognition.<name>(*args)`` in the calling (pool) process.
+
+    Tasks are submitted by name: pickling the function itself would make the
+    submitting web worker import core.recognition, and with it cv2 and dlib.
+    """
+    from . import recognition
+    return getattr(recognition, name)(*args)
+
+
+def get_executor():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = settings.RECOGNITION_POOL_WORKERS
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(settings.RECOGNITION_POOL_START_METHOD),
+                initializer=init_worker,
+            )
+            _slots = threading.BoundedSemaphore(settings.RECOGNITION_QUEUE_DEPTH or workers * 4)
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_recognition(name, *args):
+    """Run ``core.recognition.<name>(*args)`` in the recognition pool and return its result."""
+    if not settings.RECOGNITION_POOL_WORKERS:
+        return call_recognition(name, *args)
+
+    executor = get_executor()
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise RecognitionBusy('Recognition queue is full')
+
+    try:
+        future = executor.submit(call_recognition, name, *args)
+    except BrokenProcessPool:
+        slots.release()
+        shutdown_executor()
+        raise RecognitionUnavailable('Recognition pool is restarting')
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        return future.result(timeout=settings.RECOGNITION_TASK_TIMEOUT)
+    except FutureTimeoutError:
+        future.cancel()
+        raise RecognitionTimeout('Recognition timed out')
+    except BrokenProcessPool:
+        logger.error('Recognition pool process died; restarting pool')
+        shutdown_executor()
+        raise RecognitionUnavailable('Recognition pool is restarting')
@@ -0,0 +1,88 @@
+"""Per-kiosk near-duplicate frame detection.
+
+Each device's last frame fingerprint (``frame_hash``) and
+face encodings are remembered. A new frame from the same device whose
+fingerprint is within ``FRAME_DEDUP_MAX_DISTANCE`` bits, sent within
+``FRAME_DEDUP_TTL`` seconds, reuses those encodings and skips decoding,
+detection and encoding. Matching and the attendance decision are never
+skipped.
+
+Fingerprints are computed with Pillow in the web process, which therefore
+never needs to import OpenCV.
+"""
+import io
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+
+def frame_hash(img_bytes):
+    """64-bit dHash of a tiny grayscale thumbnail, or None if the image cannot be decoded.
+
+    JPEGs are decoded at 1/8 scale, so this costs a fraction of a full decode.
+    """
+    try:
+        with Image.open(io.BytesIO(img_bytes)) as im:
+            im.draft('L', (max(1, im.width // 8), max(1, im.height // 8)))
+            thumb = np.asarray(im.convert('L').resize((9, 8), Image.Resampling.BOX), dtype=np.int16)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    bits = thumb[:, 1:] > thumb[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class FrameDeduplicator:
+    def __init__(self, max_devices, ttl, max_distance):
+        self.max_devices = max_devices
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._devices = OrderedDict()  # device_id -> (fingerprint, expires, encodings)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, device_id, fingerprint):
+        """The previous frame's encodings for device_id if this frame is a near-duplicate of it."""
+        if not self.max_devices:
+            return None
+        with self._lock:
+            entry = self._devices.get(device_id)
+            if entry is not None:
+                previous, expires, encodings = entry
+                if expires > time.monotonic() and bin(previous ^ fingerprint).count('1') <= self.max_distance:
+                    self.hits += 1
+                    return encodings
+            self.misses += 1
+            return None
+
+    def put(self, device_id, fingerprint, encodings):
+        if not self.max_devices:
+            return
+        with self._lock:
+            self._devices[device_id] = (fingerprint, time.monotonic() + self.ttl, encodings)
+            self._devices.move_to_end(device_id)
+            while len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._devices.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+frame_dedup = FrameDeduplicator(
+    max_devices=settings.FRAME_DEDUP_MAX_DEVICES,
+    ttl=settings.FRAME_DEDUP_TTL,
+    max_distance=settings.FRAME_DEDUP_MAX_DISTANCE,
+)
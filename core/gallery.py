@@ -0,0 +1,354 @@
+"""In-memory face gallery used by the recognition views.
+
+Every active employee encoding is kept in one contiguous NumPy matrix with
+parallel id arrays, so a probe is matched with a single vectorized distance
+computation instead of a per-employee Python loop and a DB query per frame.
+An employee may have several rows (primary encoding plus FaceTemplates);
+rows are grouped by employee and the per-employee minimum is taken with one
+segmented reduction. With ``FACE_GALLERY_QUANTIZED`` the matrix is replaced
+by int8 codes (see ``core.quantize``) and the few plausible candidates are
+re-ranked against their full-precision rows, which stay in the memory-mapped
+snapshot so only the pages of those rows are ever read.
+Rows are ordered by location, so ``for_location()`` gives a kiosk a
+zero-copy partition holding only the employees of its location.
+The gallery is rebuilt lazily after ``invalidate_gallery()`` is called
+(see ``core.signals``). With ``FACE_GALLERY_SNAPSHOT_ENABLED`` the matrix is
+memory-mapped from a snapshot file shared by every worker (see
+``core.snapshot``) instead of being loaded per process; other processes
+notice a change by the replaced file. Without the snapshot they notice it
+by the ``GalleryVersion`` row, read once per match.
+"""
+import copy
+import logging
+import threading
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+
+from .snapshot import SnapshotError, open_snapshot, read_version, snapshot_lock, snapshot_stamp, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+ENCODING_SIZE = 128
+
+
+class FaceGallery:
+    """Immutable snapshot of all matchable encodings, one row per template."""
+
+    def __init__(self, encodings, employee_ids, user_ids, location_ids=None):
+        self.encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        self.employee_ids = np.asarray(employee_ids, dtype=np.int64)
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        if location_ids is None:
+            location_ids = np.zeros(len(self.employee_ids), dtype=np.int64)
+        self.location_ids = np.asarray(location_ids, dtype=np.int64)
+
+        location_step = np.diff(self.location_ids)
+        if np.any((location_step < 0) | ((location_step == 0) & (np.diff(self.employee_ids) < 0))):
+            # Group rows by location, and each employee's templates into one contiguous segment
+            order = np.lexsort((self.employee_ids, self.location_ids))
+            self.encodings = self.encodings[order]
+            self.employee_ids = self.employee_ids[order]
+            self.user_ids = self.user_ids[order]
+            self.location_ids = self.location_ids[order]
+
+        self._index_segments()
+        # Location id -> (start, end) rows
+        locations, starts = np.unique(self.location_ids, return_index=True)
+        ends = np.append(starts[1:], len(self.location_ids))
+        self.location_bounds = {int(loc): (int(start), int(end)) for loc, start, end in zip(locations, starts, ends)}
+        self._partitions = {}
+        self._partitions_lock = threading.Lock()
+
+        self.index = None
+        self.n_probe = None
+        self.quantized = None
+        self.exact_encodings = None
+        self.rerank = None
+        self.stamp = None
+
+    def _index_segments(self):
+        # Segment i spans rows segment_starts[i]:segment_ends[i], all belonging to segment_employee_ids[i]
+        self.segment_starts = np.flatnonzero(np.diff(self.employee_ids, prepend=-1))
+        self.segment_ends = np.append(self.segment_starts[1:], len(self.employee_ids))
+        self.segment_employee_ids = self.employee_ids[self.segment_starts]
+
+    def __len__(self):
+        return len(self.employee_ids)
+
+    @property
+    def employee_count(self):
+        return len(self.segment_starts)
+
+    @classmethod
+    def from_db(cls):
+        """Load the primary encodings and templates of every active employee (two queries)."""
+        return cls(*load_encodings())
+
+    @classmethod
+    def from_snapshot(cls, path):
+        """Map the shared snapshot file; encodings are not copied into this process."""
+        _, encodings, employee_ids, user_ids, location_ids = open_snapshot(path)
+        return cls(encodings, employee_ids, user_ids, location_ids)
+
+    def for_location(self, location_id):
+        """Gallery of the employees assigned to ``location_id``, sharing this gallery's arrays."""
+        with self._partitions_lock:
+            partition = self._partitions.get(location_id)
+            if partition is None:
+                start, end = self.location_bounds.get(location_id, (0, 0))
+                partition = self._partitions[location_id] = self._slice(start, end)
+        return partition
+
+    def _slice(self, start, end):
+        part = copy.copy(self)
+        if self.encodings is not None:
+            part.encodings = self.encodings[start:end]
+        if self.quantized is not None:
+            part.quantized = self.quantized.slice(start, end)
+            part.exact_encodings = self.exact_encodings[start:end]
+        part.employee_ids = self.employee_ids[start:end]
+        part.user_ids = self.user_ids[start:end]
+        part.location_ids = self.location_ids[start:end]
+        part._index_segments()
+        part.location_bounds = {}
+        part._partitions = {}
+        part._partitions_lock = threading.Lock()
+        # Index row numbers refer to the whole gallery; partitions are scanned directly
+        part.index = None
+        return part
+
+    def build_index(self, path=None, n_probe=8, train=True):
+        """Attach an approximate nearest-neighbour index (see ``core.ann``) used by best_match.
+
+        With ``train=False`` only a persisted index is used; the gallery keeps
+        scanning exactly if there is none. Returns whether an index is attached.
+        """
+        from .ann import IVFIndex
+
+        self.index = IVFIndex.build(self.encodings, self.employee_ids, path=path, train=train)
+        self.n_probe = n_probe
+        return self.index is not None
+
+    def quantize(self, rerank=8):
+        """Scan int8 codes (see ``core.quantize``) instead of the float32 matrix.
+
+        best_match re-ranks its candidates, at least ``rerank`` rows, against
+        the float32 rows. Those are only read row by row, so a gallery mapped
+        from the snapshot keeps them out of the process' resident memory.
+        """
+        from .quantize import QuantizedEncodings
+
+        self.quantized = QuantizedEncodings.from_encodings(self.encodings)
+        self.exact_encodings = self.encodings
+        self.rerank = rerank
+        self.encodings = None
+        self.index = None
+
+    def employee_distance(self, employee_id, probe):
+        """Exact distance from ``probe`` to the closest row of ``employee_id``, or None if they have no rows."""
+        rows = np.flatnonzero(self.employee_ids == employee_id)
+        if not len(rows):
+            return None
+        encodings = self.encodings if self.encodings is not None else self.exact_encodings
+        return float(np.linalg.norm(encodings[rows] - np.asarray(probe, dtype=np.float32), axis=1).min())
+
+    def distances(self, probe):
+        """Euclidean distance from ``probe`` to every encoding (same metric as face_recognition.face_distance)."""
+        probe = np.asarray(probe, dtype=np.float32)
+        return np.linalg.norm(self.encodings - probe, axis=1)
+
+    def best_match(self, probe, threshold=None):
+        """Return ``(employee_id, distance)`` of the closest encoding, or ``(None, None)`` if empty.
+
+        With a quantized gallery the distance is exact whenever it is below
+        ``threshold``; above it, it may be approximate.
+        """
+        if not len(self):
+            return None, None
+        probe = np.asarray(probe, dtype=np.float32)
+
+        if self.quantized is not None:
+            return self._best_match_quantized(probe, threshold)
+
+        if self.index is not None:
+            # Exact re-rank of the candidate partitions only
+            rows = self.index.candidates(probe, self.n_probe)
+            if len(rows):
+                distances = np.linalg.norm(self.encodings[rows] - probe, axis=1)
+                best = int(np.argmin(distances))
+                row = int(rows[best])
+                return int(self.employee_ids[row]), float(distances[best])
+
+        # Closest template of each employee in one segmented reduction
+        per_employee = np.minimum.reduceat(self.distances(probe), self.segment_starts)
+        segment = int(np.argmin(per_employee))
+        return int(self.segment_employee_ids[segment]), float(per_employee[segment])
+
+    def _best_match_quantized(self, probe, threshold):
+        approx = self.quantized.distances(probe)
+        bound = self.quantized.error_bound
+        best = int(np.argmin(approx))
+        if threshold is not None and approx[best] - bound >= threshold:
+            # Every exact distance is over the threshold as well: reject without reading any float row
+            return int(self.employee_ids[best]), float(approx[best])
+
+        # Every row that could still be the exact nearest one, and at least the `rerank` closest
+        rows = np.flatnonzero(approx <= approx[best] + 2 * bound)
+        if len(rows) < self.rerank:
+            rows = np.argpartition(approx, min(self.rerank, len(approx)) - 1)[:self.rerank]
+        rows = np.sort(rows)  # sequential reads of the mapped rows
+        distances = np.linalg.norm(self.exact_encodings[rows] - probe, axis=1)
+        best = int(np.argmin(distances))
+        return int(self.employee_ids[rows[best]]), float(distances[best])
+
+    def best_matches(self, probes, threshold=None):
+        """Vectorized best_match for a batch of probes; returns one ``(employee_id, distance)`` per probe."""
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if not len(self):
+            return [(None, None)] * len(probes)
+        if self.index is not None or self.quantized is not None:
+            return [self.best_match(probe, threshold) for probe in probes]
+
+        # ||p - e||^2 = ||p||^2 - 2 p.e + ||e||^2 picks the nearest row for all probes at once
+        squared = (
+            np.einsum('ij,ij->i', probes, probes)[:, None]
+            - 2.0 * probes @ self.encodings.T
+            + np.einsum('ij,ij->i', self.encodings, self.encodings)[None, :]
+        )
+        segments = np.argmin(np.minimum.reduceat(squared, self.segment_starts, axis=1), axis=1)
+
+        results = []
+        for probe, segment in zip(probes, segments):
+            # Report the exact distance so threshold decisions match best_match
+            rows = self.encodings[self.segment_starts[segment]:self.segment_ends[segment]]
+            distance = np.linalg.norm(rows - probe, axis=1).min()
+            results.append((int(self.segment_employee_ids[segment]), float(distance)))
+        return results
+
+
+def load_encodings():
+    """``(matrix, employee_ids, user_ids, location_ids)`` of the primary encodings and templates of active employees."""
+    from .models import Employee, FaceTemplate
+
+    primary = Employee.objects.filter(
+        face_encoding_format=Employee.ENCODING_FORMAT_FLOAT32,
+        user__is_active=True,
+    )
+    templates = FaceTemplate.objects.filter(employee__user__is_active=True)
+
+    encodings = []
+    ids = []
+    user_ids = []
+    location_ids = []
+    for employee_id, user_id, location_id, encoding_bytes in chain(
+        primary.values_list('id', 'user_id', 'location_id', 'face_encoding_bin').iterator(),
+        templates.values_list('employee_id', 'employee__user_id', 'employee__location_id', 'encoding').iterator(),
+    ):
+        encoding = np.frombuffer(encoding_bytes, dtype=np.float32)
+        if encoding.shape != (ENCODING_SIZE,):
+            # skip malformed encodings
+            continue
+        encodings.append(encoding)
+        ids.append(employee_id)
+        user_ids.append(user_id)
+        location_ids.append(location_id or 0)
+
+    matrix = np.vstack(encodings) if encodings else np.empty((0, ENCODING_SIZE), dtype=np.float32)
+    return matrix, ids, user_ids, location_ids
+
+
+_lock = threading.Lock()
+_gallery = None
+_generation = 0
+
+
+def _snapshot_path():
+    return settings.FACE_GALLERY_SNAPSHOT_PATH if settings.FACE_GALLERY_SNAPSHOT_ENABLED else None
+
+
+def _db_version():
+    from .models import GalleryVersion
+    return GalleryVersion.current()
+
+
+def _load_gallery(path):
+    if path is None:
+        # Read before loading: a change made meanwhile triggers another reload
+        version = _db_version()
+        gallery = FaceGallery.from_db()
+        gallery.stamp = version
+        return gallery
+
+    try:
+        if not read_version(path):
+            # Missing, or written in an older format
+            publish_snapshot(path)
+        stamp = snapshot_stamp(path)
+        gallery = FaceGallery.from_snapshot(path)
+    except (OSError, SnapshotError):
+        logger.warning('Falling back to DB gallery; snapshot %s unusable', path, exc_info=True)
+        gallery = FaceGallery.from_db()
+        # Stamped with the file we failed on, so it is kept until that file changes
+        stamp = snapshot_stamp(path)
+    gallery.stamp = stamp
+    return gallery
+
+
+def get_gallery():
+    """Return the process-local gallery, reloading it if it was invalidated or changed by another process."""
+    global _gallery
+    path = _snapshot_path()
+    gallery = _gallery
+    if gallery is not None and gallery.stamp == (_db_version() if path is None else snapshot_stamp(path)):
+        return gallery
+
+    with _lock:
+        generation = _generation
+
+    gallery = _load_gallery(path)
+    if settings.FACE_GALLERY_QUANTIZED:
+        gallery.quantize(rerank=settings.FACE_GALLERY_RERANK)
+    elif settings.FACE_ANN_ENABLED and len(gallery) >= settings.FACE_ANN_MIN_GALLERY_SIZE:
+        # Training takes seconds; it belongs to manage.py build_face_index, never to a request
+        if not gallery.build_index(settings.FACE_ANN_INDEX_PATH, settings.FACE_ANN_N_PROBE, train=False):
+            logger.warning('No usable face index at %s; scanning exactly. Run manage.py build_face_index.', settings.FACE_ANN_INDEX_PATH)
+
+    with _lock:
+        # Only publish if nothing changed while we were loading
+        if generation == _generation:
+            _gallery = gallery
+    return gallery
+
+
+def publish_snapshot(path=None):
+    """Rebuild the shared snapshot file from the DB; other workers remap it on their next match."""
+    path = path or _snapshot_path()
+    if path is None:
+        return None
+    # Read and write under one lock: a concurrent publisher that read the DB earlier must not replace us
+    with snapshot_lock(path):
+        gallery = FaceGallery.from_db()
+        return write_snapshot(path, gallery.encodings, gallery.employee_ids, gallery.user_ids, gallery.location_ids)
+
+
+def invalidate_gallery():
+    """Drop the cached gallery so the next match reloads it."""
+    global _gallery, _generation
+    with _lock:
+        _gallery = None
+        _generation += 1
+
+
+def refresh_gallery():
+    """Called after encodings change: tell every process (snapshot or version row) and drop the local copy."""
+    if _snapshot_path() is None:
+        from .models import GalleryVersion
+        GalleryVersion.bump()
+    else:
+        try:
+            publish_snapshot()
+        except OSError:
+            logger.warning('Could not write gallery snapshot', exc_info=True)
+    invalidate_gallery()
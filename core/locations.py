@@ -0,0 +1,56 @@
+"""Which part of the face gallery a kiosk matches against.
+
+A registered, active ``Device`` with a ``Location`` matches the employees of
+that location first (``FaceGallery.for_location``) and, if the location
+allows it, everyone else when nobody local matches. Unknown devices, and
+requests without a device id, keep matching the whole gallery.
+
+Lookups are cached per process for ``DEVICE_SCOPE_TTL`` seconds and cleared
+whenever a Device or Location is saved or deleted (see core/signals.py).
+"""
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+# Device ids come from the request, so bound the cache
+MAX_CACHED_DEVICES = 4096
+
+Scope = namedtuple('Scope', ['location_id', 'fallback_to_global'])
+
+
+class DeviceScopes:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._scopes = {}  # device_id -> (Scope or None, expires)
+
+    def get(self, device_id):
+        """Scope of device_id, or None to match against the whole gallery."""
+        if not device_id:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._scopes.get(device_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        from .models import Device
+
+        scope = None
+        device = Device.objects.filter(device_id=device_id, is_active=True).select_related('location').first()
+        if device is not None and device.location is not None:
+            scope = Scope(device.location_id, device.location.fallback_to_global)
+        with self._lock:
+            if len(self._scopes) >= MAX_CACHED_DEVICES:
+                self._scopes.clear()
+            self._scopes[device_id] = (scope, now + self.ttl)
+        return scope
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+
+
+device_scopes = DeviceScopes(ttl=settings.DEVICE_SCOPE_TTL)
@@ -0,0 +1,229 @@
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.gallery import ENCODING_SIZE, FaceGallery
+from core.snapshot import write_snapshot
+
+# Distance of synthetic probes from their gallery row, well inside the 0.48 match threshold
+PROBE_NOISE = 0.02
+THRESHOLD = 0.48
+
+
+def _summary(name, samples, **extra):
+    """Latency percentiles (ms) and throughput of a list of per-call durations (s)."""
+    samples = np.asarray(samples)
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    result = {'name': name}
+    result.update(extra)
+    result.update({
+        'iterations': len(samples),
+        'p50Ms': round(float(p50), 4),
+        'p95Ms': round(float(p95), 4),
+        'p99Ms': round(float(p99), 4),
+        'meanMs': round(float(samples.mean()) * 1000, 4),
+        'throughputPerSec': round(len(samples) / float(samples.sum()), 2),
+    })
+    return result
+
+
+def _time_calls(fn, args_list, max_seconds):
+    """Time fn(*args) for each args in args_list, stopping early (after >= 3 calls) once max_seconds is spent."""
+    samples = []
+    started = time.perf_counter()
+    for args in args_list:
+        t = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - t)
+        if len(samples) >= 3 and time.perf_counter() - started > max_seconds:
+            break
+    return samples
+
+
+def synthetic_gallery(size, seed=0, locations=0):
+    """Random unit-length encodings (face_recognition encodings have a norm close to 1).
+
+    With ``locations``, employees are spread round-robin over location ids 1..locations.
+    """
+    rng = np.random.default_rng(seed)
+    encodings = rng.standard_normal((size, ENCODING_SIZE)).astype(np.float32)
+    encodings /= np.linalg.norm(encodings, axis=1, keepdims=True)
+    ids = np.arange(1, size + 1)
+    location_ids = ids % locations + 1 if locations else None
+    return FaceGallery(encodings, ids, ids, location_ids)
+
+
+def synthetic_probes(gallery, count, seed=1):
+    """Probes near random gallery rows, paired with the employee id they should match."""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(gallery), count)
+    noise = rng.standard_normal((count, ENCODING_SIZE)).astype(np.float32)
+    noise *= PROBE_NOISE / np.linalg.norm(noise, axis=1, keepdims=True)
+    return gallery.encodings[rows] + noise, gallery.employee_ids[rows]
+
+
+def legacy_loop_match(employees, probe):
+    """The original per-employee matching loop, kept as the baseline."""
+    import face_recognition
+
+    best_match = None
+    best_distance = 1.0
+    for emp_id, emp_encoding in employees:
+        distance = face_recognition.face_distance([emp_encoding], probe)[0]
+        if distance < best_distance:
+            best_distance = distance
+            best_match = emp_id
+    return best_match, best_distance
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark face matching on synthetic galleries and the decode/detect/encode pipeline on a '
+        'sample photo. Prints p50/p95/p99 latency and throughput as JSON for comparison between runs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000', help='Comma-separated synthetic gallery sizes')
+        parser.add_argument('--locations', type=int, default=10, help='Locations the gallery is split into for the per-location case')
+        parser.add_argument('--iterations', type=int, default=200, help='Probes timed per matcher and gallery size')
+        parser.add_argument('--max-seconds', type=float, default=10.0, help='Time budget per case; slow cases stop early')
+        parser.add_argument('--image', default=os.path.join(settings.BASE_DIR, 'media', 'demo_face.jpg'), help='Photo for the pipeline benchmark')
+        parser.add_argument('--pipeline-iterations', type=int, default=20, help='Runs of the full pipeline')
+        parser.add_argument('--skip-pipeline', action='store_true', help='Only benchmark matching')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes must be a comma-separated list of integers')
+
+        results = []
+        for size in sizes:
+            self.stderr.write(f'Matching, gallery of {size}...')
+            results.extend(self._bench_matching(size, options['iterations'], options['max_seconds'], options['locations']))
+        if not options['skip_pipeline']:
+            self.stderr.write('Pipeline...')
+            results.extend(self._bench_pipeline(options['image'], options['pipeline_iterations'], options['max_seconds']))
+
+        report = {
+            'timestamp': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'cpuCount': os.cpu_count(),
+                'recognitionPoolWorkers': settings.RECOGNITION_POOL_WORKERS,
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+    def _bench_matching(self, size, iterations, max_seconds, locations):
+        gallery = synthetic_gallery(size)
+        probes, expected = synthetic_probes(gallery, iterations)
+        results = []
+
+        # The legacy loop decoded float64 encodings per employee
+        employees = [(int(emp_id), enc.astype(np.float64)) for emp_id, enc in zip(gallery.employee_ids, gallery.encodings)]
+        probes64 = probes.astype(np.float64)
+        samples = _time_calls(legacy_loop_match, [(employees, probe) for probe in probes64], max_seconds)
+        results.append(_summary('match.legacy_loop', samples, gallerySize=size))
+
+        samples = _time_calls(gallery.best_match, [(probe,) for probe in probes], max_seconds)
+        results.append(_summary('match.vectorized', samples, gallerySize=size))
+
+        # Batched matching, e.g. group check-in: report per-probe cost
+        batch = 16
+        batches = [(probes[start:start + batch],) for start in range(0, len(probes) - batch + 1, batch)]
+        if batches:
+            samples = _time_calls(gallery.best_matches, batches, max_seconds)
+            results.append(_summary(
+                'match.vectorized_batch', np.asarray(samples) / batch, gallerySize=size, batchSize=batch,
+            ))
+
+        # A kiosk matching only its own location's partition
+        if locations > 1:
+            partitioned = synthetic_gallery(size, locations=locations)
+            partition = partitioned.for_location(1)
+            samples = _time_calls(partition.best_match, [(probe,) for probe in probes], max_seconds)
+            results.append(_summary('match.location', samples, gallerySize=size, locations=locations, partitionSize=len(partition)))
+
+        t = time.perf_counter()
+        indexed = synthetic_gallery(size)
+        indexed.build_index(n_probe=settings.FACE_ANN_N_PROBE)
+        build_ms = round((time.perf_counter() - t) * 1000, 2)
+        samples = _time_calls(indexed.best_match, [(probe,) for probe in probes], max_seconds)
+        matched = [indexed.best_match(probe)[0] for probe in probes[:len(samples)]]
+        recall = float(np.mean(np.asarray(matched) == expected[:len(samples)]))
+        results.append(_summary(
+            'match.ann', samples, gallerySize=size, nProbe=settings.FACE_ANN_N_PROBE,
+            buildMs=build_ms, recall=round(recall, 4),
+        ))
+
+        # int8 gallery as served: mapped from a snapshot file, re-ranked against the mapped float rows
+        full = synthetic_gallery(size)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'gallery.bin')
+            write_snapshot(path, full.encodings, full.employee_ids, full.user_ids, full.location_ids)
+            quantized = FaceGallery.from_snapshot(path)
+            t = time.perf_counter()
+            quantized.quantize(rerank=settings.FACE_GALLERY_RERANK)
+            build_ms = round((time.perf_counter() - t) * 1000, 2)
+            results.append(self._bench_quantized(quantized, full, probes, size, build_ms, max_seconds))
+        return results
+
+    def _bench_quantized(self, quantized, gallery, probes, size, build_ms, max_seconds):
+        # Half the probes are strangers, to cover rejections too
+        strangers = synthetic_gallery(len(probes), seed=2).encodings
+        mixed = np.where((np.arange(len(probes)) % 2 == 0)[:, None], probes, strangers)
+        samples = _time_calls(quantized.best_match, [(probe, THRESHOLD) for probe in mixed], max_seconds)
+
+        def decision(match):
+            employee_id, distance = match
+            return employee_id if distance < THRESHOLD else None
+        agreement = np.mean([
+            decision(quantized.best_match(probe, THRESHOLD)) == decision(gallery.best_match(probe))
+            for probe in mixed[:len(samples)]
+        ])
+        return _summary(
+            'match.quantized', samples, gallerySize=size, buildMs=build_ms, rerank=quantized.rerank,
+            bytesPerRow=round(quantized.quantized.nbytes / size, 1), floatBytesPerRow=gallery.encodings.nbytes // size,
+            decisionAgreement=round(float(agreement), 4),
+        )
+
+    def _bench_pipeline(self, image, iterations, max_seconds):
+        from core.recognition import decode_probe, encode_image, encode_probe, probe_encodings
+
+        try:
+            with open(image, 'rb') as f:
+                img_bytes = f.read()
+        except OSError as e:
+            raise CommandError(f'Cannot read {image}: {e}')
+        rgb_img = decode_probe(img_bytes)
+        if rgb_img is None:
+            raise CommandError(f'{image} is not a decodable image')
+
+        # First call loads the dlib models; keep it out of the numbers
+        encode_probe(img_bytes)
+
+        runs = [(img_bytes,)] * iterations
+        return [
+            _summary('pipeline.decode', _time_calls(decode_probe, runs, max_seconds)),
+            _summary('pipeline.detect_encode', _time_calls(probe_encodings, [(rgb_img,)] * iterations, max_seconds)),
+            _summary('pipeline.probe', _time_calls(encode_probe, runs, max_seconds)),
+            _summary('pipeline.enrollment', _time_calls(encode_image, runs, max_seconds)),
+        ]
@@ -0,0 +1,94 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+# Each case runs in a fresh interpreter; "{setup}" configures Django and loads the URLconf like a web worker does
+SETUP = (
+    "import os, django; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'visiontrack.settings'); "
+    "django.setup(); from django.urls import get_resolver; get_resolver().url_patterns; "
+)
+CASES = {
+    # What every web worker and management command pays now
+    'urls': SETUP,
+    # What they paid while core.views imported the recognition stack at module level
+    'urls_with_recognition': SETUP + 'import core.recognition',
+    # Cost of the recognition stack alone, paid by the first recognition request or the pool processes
+    'recognition_only': 'import core.recognition',
+}
+
+
+def _run(argv):
+    """Run argv to completion; returns (wall seconds, peak RSS in MiB, exit code)."""
+    started = time.perf_counter()
+    process = subprocess.Popen(argv, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    # Drain stderr before waiting: a child filling the pipe would otherwise block forever.
+    # communicate() cannot be used, it reaps the child before wait4 can read its resource usage.
+    with process.stderr:
+        errors = process.stderr.read()
+    # wait4 reports the resource usage of this child only
+    _, wait_status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(wait_status)
+    if process.returncode:
+        sys.stderr.write(errors.decode(errors='replace'))
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return elapsed, rss, process.returncode
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure process start-up time and peak RSS of manage.py commands and of loading the URLconf, '
+        'with and without the cv2/dlib recognition stack. Prints a JSON report.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--commands', default='check,showmigrations', help='Comma-separated manage.py commands to time')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per case')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        cases = {name: [sys.executable, '-c', code] for name, code in CASES.items()}
+        for command in options['commands'].split(','):
+            if command.strip():
+                cases[f'manage.py {command.strip()}'] = [sys.executable, 'manage.py', command.strip()]
+
+        results = []
+        for name, argv in cases.items():
+            self.stderr.write(f'{name}...')
+            runs = [_run(argv) for _ in range(options['repeat'])]
+            walls = np.array([wall for wall, _, _ in runs])
+            results.append({
+                'name': name,
+                'runs': len(runs),
+                'failures': sum(1 for _, _, code in runs if code),
+                'p50Ms': round(float(np.percentile(walls, 50)) * 1000, 1),
+                'minMs': round(float(walls.min()) * 1000, 1),
+                'maxRssMiB': round(max(rss for _, rss, _ in runs), 1),
+            })
+
+        by_name = {result['name']: result for result in results}
+        lazy, eager = by_name['urls'], by_name['urls_with_recognition']
+        report = {
+            'timestamp': timezone.now().isoformat(),
+            'python': sys.version.split()[0],
+            'results': results,
+            'lazyImportSavings': {
+                'startupMs': round(eager['p50Ms'] - lazy['p50Ms'], 1),
+                'rssMiB': round(eager['maxRssMiB'] - lazy['maxRssMiB'], 1),
+            },
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        else:
+            self.stdout.write(output)
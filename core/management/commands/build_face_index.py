@@ -0,0 +1,41 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.ann import IVFIndex
+from core.gallery import FaceGallery, publish_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Train (or incrementally update) the IVF face index at FACE_ANN_INDEX_PATH. Web workers only load '
+        'this file, so run it at deploy time and after large enrollment changes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retrain', action='store_true', help='Train k-means from scratch instead of updating the existing index')
+        parser.add_argument('--force', action='store_true', help='Build even when FACE_ANN_ENABLED is off')
+
+    def handle(self, *args, **options):
+        if not (settings.FACE_ANN_ENABLED or options['force']):
+            self.stdout.write('FACE_ANN_ENABLED is off; nothing to do')
+            return
+
+        gallery = FaceGallery.from_db()
+        if len(gallery) < settings.FACE_ANN_MIN_GALLERY_SIZE and not options['force']:
+            self.stdout.write(f'Gallery has {len(gallery)} encodings, below FACE_ANN_MIN_GALLERY_SIZE; nothing to do')
+            return
+
+        path = settings.FACE_ANN_INDEX_PATH
+        if options['retrain'] and os.path.exists(path):
+            os.remove(path)
+        started = time.monotonic()
+        index = IVFIndex.build(gallery.encodings, gallery.employee_ids, path=path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Index of {len(gallery)} encodings in {len(index.centroids)} lists written to {path} '
+            f'in {time.monotonic() - started:.1f}s'
+        ))
+        # Bump the shared snapshot so running workers reload their gallery and pick the index up
+        publish_snapshot()
@@ -0,0 +1,229 @@
+import csv
+import json
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from core import encoding_cache
+from core.executor import init_worker
+from core.gallery import refresh_gallery
+from core.models import Employee, FaceTemplate
+from core.recognition import encode_image
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Enroll employee face photos in bulk from a directory or zip. The mapping CSV needs the '
+        'columns "employee" (email or empId) and "filename". The first photo of an employee '
+        'becomes their primary encoding, further ones are added as face templates. Progress is '
+        'recorded in a state file, so an interrupted run resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directory or .zip containing the photos')
+        parser.add_argument('mapping', help='CSV file with columns "employee" and "filename"')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Encoding processes (default: all cores)')
+        parser.add_argument('--batch-size', type=int, default=200, help='Photos encoded and written per batch')
+        parser.add_argument('--state-file', help='Progress file (default: <mapping>.state)')
+
+    def handle(self, *args, **options):
+        rows = self._read_mapping(options['mapping'])
+        state_path = options['state_file'] or options['mapping'] + '.state'
+        done = self._load_done(state_path)
+        pending = [row for row in rows if (row['employee'], row['filename']) not in done and (row['employee'], None) not in done]
+        self.stdout.write(f'{len(rows)} mapped photos, {len(rows) - len(pending)} already enrolled, {len(pending)} to process')
+
+        try:
+            if pending:
+                self._enroll(pending, options, state_path)
+        finally:
+            # bulk_update/bulk_create bypass the post_save gallery signals. Refresh even when nothing is
+            # pending or the run is interrupted: a previous run may have written employees without it.
+            refresh_gallery()
+
+    def _enroll(self, pending, options, state_path):
+        users = self._resolve_users([row['employee'] for row in pending])
+        read_photo = self._photo_reader(options['source'])
+        # Users whose primary encoding was set by this run; their further photos become templates
+        primaries = set()
+
+        enrolled = failed = 0
+        # Child processes must not inherit open DB connections
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context(settings.RECOGNITION_POOL_START_METHOD),
+            initializer=init_worker,
+        ) as pool, open(state_path, 'a') as state_file:
+            batch_size = options['batch_size']
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                ok, errors = self._process_batch(batch, users, read_photo, pool, primaries)
+                enrolled += len(ok)
+                failed += len(errors)
+
+                for row, message in errors:
+                    self.stdout.write(self.style.WARNING(f'  {row["employee"]} ({row["filename"]}): {message}'))
+                    state_file.write(json.dumps({**row, 'status': 'failed', 'message': message}) + '\n')
+                for row in ok:
+                    state_file.write(json.dumps({**row, 'status': 'done'}) + '\n')
+                state_file.flush()
+                self.stdout.write(f'Processed {min(start + batch_size, len(pending))}/{len(pending)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Enrolled {enrolled} photos of {len(primaries)} employees, {failed} failures'
+        ))
+
+    def _process_batch(self, batch, users, read_photo, pool, primaries):
+        errors = []
+        jobs = []
+        for row in batch:
+            user = users.get(row['employee'])
+            if user is None:
+                errors.append((row, 'Employee user not found'))
+                continue
+            try:
+                img_bytes = read_photo(row['filename'])
+            except (OSError, KeyError):
+                errors.append((row, f'Photo {row["filename"]} not found'))
+                continue
+            jobs.append((row, user, img_bytes))
+
+        # Only photos not seen before go to the pool
+        results = [encoding_cache.lookup(img_bytes) for _, _, img_bytes in jobs]
+        misses = [i for i, encodings in enumerate(results) if encodings is None]
+        computed = pool.map(encode_image, [jobs[i][2] for i in misses], chunksize=4)
+        for i, encodings in zip(misses, computed):
+            results[i] = encodings
+            if encodings is not None:
+                encoding_cache.store(jobs[i][2], encodings)
+
+        enrolled = []
+        for (row, user, img_bytes), encodings in zip(jobs, results):
+            if encodings is None:
+                errors.append((row, 'Unable to decode image'))
+            elif not encodings:
+                errors.append((row, 'No face detected in the image'))
+            else:
+                enrolled.append((row, user, img_bytes, encodings[0]))
+
+        # The first photo of a user sets their primary encoding, the rest are kept as templates
+        batch_primaries = {}
+        templates = []
+        for row, user, img_bytes, encoding in enrolled:
+            if user.id in primaries or user.id in batch_primaries:
+                templates.append((row, user, img_bytes, encoding))
+            else:
+                batch_primaries[user.id] = (row, user, img_bytes, encoding)
+
+        # Files are written before the transaction and removed again if it rolls back
+        saved = []
+        try:
+            images = {}
+            for row, _, img_bytes, _ in enrolled:
+                name = default_storage.save(f'employee_images/{os.path.basename(row["filename"])}', ContentFile(img_bytes))
+                saved.append(name)
+                images[id(row)] = name
+
+            with transaction.atomic():
+                existing = {emp.user_id: emp for emp in Employee.objects.filter(user__in=[user for _, user, _, _ in enrolled])}
+                to_update = []
+                to_create = []
+                for row, user, _, encoding in batch_primaries.values():
+                    employee = existing.get(user.id) or Employee(user=user)
+                    employee.image = images[id(row)]
+                    employee.set_encoding(encoding)
+                    (to_update if employee.pk else to_create).append(employee)
+
+                Employee.objects.bulk_update(
+                    to_update, ['image', 'face_encoding', 'face_encoding_bin', 'face_encoding_format'], batch_size=500
+                )
+                Employee.objects.bulk_create(to_create, batch_size=500)
+
+                if templates:
+                    # Not every backend sets primary keys on bulk_create, so read the employees back
+                    employees = {emp.user_id: emp for emp in Employee.objects.filter(user__in=[user for _, user, _, _ in templates])}
+                    for row, user, _, encoding in templates:
+                        FaceTemplate.add(employees[user.id], encoding, image=images[id(row)])
+        except BaseException:
+            for name in saved:
+                default_storage.delete(name)
+            raise
+
+        primaries.update(batch_primaries)
+        return [row for row, _, _, _ in enrolled], errors
+
+    def _read_mapping(self, path):
+        try:
+            with open(path, newline='') as f:
+                reader = csv.DictReader(f)
+                if not {'employee', 'filename'} <= set(reader.fieldnames or []):
+                    raise CommandError('Mapping CSV must have "employee" and "filename" columns')
+                return [
+                    {'employee': row['employee'].strip(), 'filename': row['filename'].strip()}
+                    for row in reader if row['employee'] and row['filename']
+                ]
+        except OSError as e:
+            raise CommandError(f'Cannot read mapping file: {e}')
+
+    def _load_done(self, state_path):
+        """(employee, filename) pairs recorded as enrolled by a previous (possibly interrupted) run.
+
+        Entries written before filenames were recorded count for every photo of the employee.
+        """
+        status = {}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # partially written last line of an interrupted run
+                        continue
+                    status[entry['employee'], entry.get('filename')] = entry['status']
+        return {key for key, value in status.items() if value == 'done'}
+
+    def _resolve_users(self, keys):
+        """Map each key (email, matched case-insensitively, or empId) to its employee user in one query."""
+        emails = {key.lower() for key in keys if '@' in key}
+        usernames = {key for key in keys if '@' not in key}
+        by_email = {}
+        by_username = {}
+        matches = User.objects.filter(role=User.EMPLOYEE).annotate(email_lower=Lower('email'))
+        for user in matches.filter(Q(email_lower__in=emails) | Q(username__in=usernames)):
+            by_email[user.email_lower] = user
+            by_username[user.username] = user
+        users = {}
+        for key in keys:
+            user = by_email.get(key.lower()) if '@' in key else by_username.get(key)
+            if user is not None:
+                users[key] = user
+        return users
+
+    def _photo_reader(self, source):
+        if os.path.isdir(source):
+            def read(filename):
+                with open(os.path.join(source, filename), 'rb') as f:
+                    return f.read()
+            return read
+
+        if zipfile.is_zipfile(source):
+            archive = zipfile.ZipFile(source)
+            # Allow the mapping to use either the archive path or the bare filename
+            names = {os.path.basename(name): name for name in archive.namelist()}
+
+            def read(filename):
+                return archive.read(names.get(filename, filename))
+            return read
+
+        raise CommandError(f'{source} is neither a directory nor a zip file')
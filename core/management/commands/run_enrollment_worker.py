@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.enrollment import claim_next_job, process_job
+from core.models import EnrollmentJob
+
+
+class Command(BaseCommand):
+    help = 'Process queued face enrollment jobs (run several instances to scale out)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty instead of polling')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Enrollment worker started')
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            process_job(job)
+            style = self.style.SUCCESS if job.status == EnrollmentJob.STATUS_DONE else self.style.WARNING
+            self.stdout.write(style(f'Job {job.pk} ({job.employee}): {job.status} - {job.message}'))
@@ -0,0 +1,147 @@
+"""Per-stage timings of the recognition views.
+
+Each check-in request records how long it spent in every stage (image read,
+frame dedup, pool queue, decode, detect, encode, match, DB work). The
+timings are returned to the caller in a ``Server-Timing`` header and
+aggregated into in-process histograms, which ``metrics_view`` exposes in the
+Prometheus text format together with the recognition cache counters.
+
+Histograms live in each worker process: with several gunicorn workers a
+scrape only reports the worker that happened to serve it.
+"""
+import bisect
+import functools
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Upper bounds (seconds) of the stage duration buckets
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in the Prometheus text format."""
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+stage_seconds = Histogram(
+    'visiontrack_recognition_stage_seconds',
+    'Time spent in each stage of a recognition request.',
+    ('view', 'stage'),
+    STAGE_BUCKETS,
+)
+
+
+class StageTimer:
+    """Monotonic stage timings of one request."""
+
+    def __init__(self, view):
+        self.view = view
+        self.started = time.monotonic()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - started)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self, total):
+        entries = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.stages.items()]
+        entries.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(entries)
+
+    def finish(self, response):
+        """Attach the Server-Timing header to ``response`` and record the stages in the histograms."""
+        total = time.monotonic() - self.started
+        response['Server-Timing'] = self.server_timing(total)
+        for name, seconds in self.stages.items():
+            stage_seconds.observe((self.view, name), seconds)
+        stage_seconds.observe((self.view, 'total'), total)
+        return response
+
+
+def timed_stages(view):
+    """View decorator: sets ``request.stage_timer`` and finishes it on the returned response."""
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            request.stage_timer = StageTimer(view)
+            response = view_func(request, *args, **kwargs)
+            return request.stage_timer.finish(response)
+        return wrapper
+    return decorator
+
+
+def _cache_counters():
+    from .frame_dedup import frame_dedup
+    from .probe_cache import probe_cache
+
+    stats = {'probe': probe_cache.stats(), 'frame_dedup': frame_dedup.stats()}
+    lines = []
+    for result, documentation in (
+        ('hits', 'Recognition cache lookups answered from the cache.'),
+        ('misses', 'Recognition cache lookups that missed.'),
+    ):
+        name = f'visiontrack_recognition_cache_{result}_total'
+        lines += [f'# HELP {name} {documentation}', f'# TYPE {name} counter']
+        lines += [f'{name}{{cache="{cache}"}} {values[result]}' for cache, values in stats.items()]
+    return lines
+
+
+def render_metrics():
+    return '\n'.join(stage_seconds.render() + _cache_counters()) + '\n'
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint.
+
+    Requires ``Authorization: Bearer <METRICS_TOKEN>`` when that setting is set;
+    without a token only staff users may read it, unless DEBUG is on.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_attendance_attendance_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='face_encoding_bin',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='face_encoding_format',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'None'), (1, 'Raw float32 (v1)')], default=0),
+        ),
+    ]
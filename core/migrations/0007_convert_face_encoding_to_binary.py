@@ -0,0 +1,57 @@
+import base64
+
+import numpy as np
+from django.db import migrations
+
+ENCODING_FORMAT_NONE = 0
+ENCODING_FORMAT_FLOAT32 = 1
+BATCH_SIZE = 500
+
+
+def forwards(apps, schema_editor):
+    """Convert base64 float64 text encodings into raw float32 bytes."""
+    Employee = apps.get_model('core', 'Employee')
+    batch = []
+    for emp in Employee.objects.exclude(face_encoding='').iterator(chunk_size=BATCH_SIZE):
+        try:
+            encoding = np.frombuffer(base64.b64decode(emp.face_encoding), dtype=np.float64)
+        except Exception:
+            # leave malformed encodings untouched
+            continue
+        emp.face_encoding_bin = encoding.astype(np.float32).tobytes()
+        emp.face_encoding_format = ENCODING_FORMAT_FLOAT32
+        emp.face_encoding = ''
+        batch.append(emp)
+        if len(batch) >= BATCH_SIZE:
+            Employee.objects.bulk_update(batch, ['face_encoding', 'face_encoding_bin', 'face_encoding_format'])
+            batch = []
+    if batch:
+        Employee.objects.bulk_update(batch, ['face_encoding', 'face_encoding_bin', 'face_encoding_format'])
+
+
+def backwards(apps, schema_editor):
+    """Restore the base64 float64 text encodings."""
+    Employee = apps.get_model('core', 'Employee')
+    batch = []
+    for emp in Employee.objects.filter(face_encoding_format=ENCODING_FORMAT_FLOAT32).iterator(chunk_size=BATCH_SIZE):
+        encoding = np.frombuffer(emp.face_encoding_bin, dtype=np.float32).astype(np.float64)
+        emp.face_encoding = base64.b64encode(encoding.tobytes()).decode('utf-8')
+        emp.face_encoding_bin = None
+        emp.face_encoding_format = ENCODING_FORMAT_NONE
+        batch.append(emp)
+        if len(batch) >= BATCH_SIZE:
+            Employee.objects.bulk_update(batch, ['face_encoding', 'face_encoding_bin', 'face_encoding_format'])
+            batch = []
+    if batch:
+        Employee.objects.bulk_update(batch, ['face_encoding', 'face_encoding_bin', 'face_encoding_format'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_employee_face_encoding_bin'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_enrollmentjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EncodingCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('encoder_version', models.CharField(max_length=100)),
+                ('encodings', models.BinaryField(blank=True)),
+                ('face_count', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_hash', 'encoder_version'), name='unique_encoding_cache_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_encodingcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollmentjob',
+            name='add_template',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='FaceTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(blank=True, upload_to='employee_images/')),
+                ('encoding', models.BinaryField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='face_templates', to='core.employee')),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
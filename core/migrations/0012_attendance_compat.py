@@ -0,0 +1,80 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:37
+
+from datetime import datetime, time, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+COMPAT_VIEW_SQL = """
+CREATE VIEW "core_attendance_compat" AS
+SELECT l."id" AS "id", e."id" AS "employee_id", l."checkin_time" AS "timestamp", l."id" AS "attendance_log_id"
+FROM "attendenceapp_attendancelog" l
+INNER JOIN "core_employee" e ON e."user_id" = l."employee_id"
+"""
+
+
+def backfill_attendance_logs(apps, schema_editor):
+    """Give every legacy Attendance row an AttendanceLog, so history can be served from AttendanceLog alone.
+
+    Rows predating AttendanceLog get a new log, or are linked to the log their
+    employee already has that day.
+    """
+    Attendance = apps.get_model('core', 'Attendance')
+    AttendanceLog = apps.get_model('attendenceapp', 'AttendanceLog')
+    AttendanceSettings = apps.get_model('attendenceapp', 'AttendanceSettings')
+    db = schema_editor.connection.alias
+
+    attendance_settings = AttendanceSettings.objects.using(db).filter(pk=1).first()
+    start_time = attendance_settings.start_time if attendance_settings else time(9, 0)
+    late_buffer = timedelta(minutes=attendance_settings.late_buffer_minutes if attendance_settings else 15)
+
+    orphans = list(
+        Attendance.objects.using(db).filter(attendance_log__isnull=True)
+        .select_related('employee').order_by('timestamp', 'pk')
+    )
+    if not orphans:
+        return
+    user_ids = {attendance.employee.user_id for attendance in orphans}
+    logs = {
+        (log.employee_id, log.checkin_date): log
+        for log in AttendanceLog.objects.using(db).filter(employee_id__in=user_ids, checkin_date__isnull=False)
+    }
+
+    for attendance in orphans:
+        checkin_date = timezone.localtime(attendance.timestamp).date()
+        key = (attendance.employee.user_id, checkin_date)
+        log = logs.get(key)
+        if log is None:
+            late_threshold = timezone.make_aware(datetime.combine(checkin_date, start_time)) + late_buffer
+            log = logs[key] = AttendanceLog.objects.using(db).create(
+                employee_id=attendance.employee.user_id,
+                checkin_time=attendance.timestamp,
+                checkin_date=checkin_date,
+                status='late' if attendance.timestamp > late_threshold else 'present',
+            )
+        attendance.attendance_log = log
+    Attendance.objects.using(db).bulk_update(orphans, ['attendance_log'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_location_device'),
+        ('attendenceapp', '0002_daily_checkin_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceCompat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'core_attendance_compat',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(backfill_attendance_logs, migrations.RunPython.noop),
+        migrations.RunSQL(COMPAT_VIEW_SQL, 'DROP VIEW "core_attendance_compat"'),
+    ]
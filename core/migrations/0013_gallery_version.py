@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_attendance_compat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GalleryVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,15 +1,54 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 import numpy as np
 import base64
-from PIL import Image
+import uuid
 from django.utils import timezone
-from django.core.exceptions import ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError
+
+class Location(models.Model):
+    """A branch or site. Kiosk devices of a location only match its own employees (see core.gallery)."""
+    name = models.CharField(max_length=100, unique=True)
+    fallback_to_global = models.BooleanField(
+        default=True,
+        help_text='When nobody from this location matches, match against all employees.',
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class Device(models.Model):
+    """A kiosk, identified by the X-Device-Id header (or "device" option) it sends with each frame."""
+    device_id = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=100, blank=True)
+    location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True, related_name='devices')
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.name or self.device_id
+
 
 class Employee(models.Model):
+    ENCODING_FORMAT_NONE = 0
+    ENCODING_FORMAT_FLOAT32 = 1
+
+    ENCODING_FORMAT_CHOICES = (
+        (ENCODING_FORMAT_NONE, 'None'),
+        (ENCODING_FORMAT_FLOAT32, 'Raw float32 (v1)'),
+    )
+
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, limit_choices_to={'role': 'employee'})
     image = models.ImageField(upload_to='employee_images/')
-    face_encoding = models.TextField(blank=True)  # Store encoding as base64 string
+    face_encoding = models.TextField(blank=True)  # Legacy base64 float64 encoding, superseded by face_encoding_bin
+    face_encoding_bin = models.BinaryField(blank=True, null=True)  # Raw encoding bytes, layout given by face_encoding_format
+    face_encoding_format = models.PositiveSmallIntegerField(choices=ENCODING_FORMAT_CHOICES, default=ENCODING_FORMAT_NONE)
+    location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True, related_name='employees')
 
     @property
     def name(self):
@@ -26,6 +65,29 @@ class Employee(models.Model):
     def last_name(self):
         return self.user.last_name if self.user else ""
 
+    @property
+    def has_encoding(self):
+        return self.face_encoding_format != self.ENCODING_FORMAT_NONE or bool(self.face_encoding)
+
+    def get_encoding(self):
+        """Return the stored face encoding as a float32 array, or None if there is none."""
+        if self.face_encoding_format == self.ENCODING_FORMAT_FLOAT32:
+            return np.frombuffer(self.face_encoding_bin, dtype=np.float32)
+        if self.face_encoding:
+            # Rows written before the binary column existed
+            return np.frombuffer(base64.b64decode(self.face_encoding), dtype=np.float64).astype(np.float32)
+        return None
+
+    def set_encoding(self, encoding):
+        """Store ``encoding`` (or clear it when None) in the binary column."""
+        if encoding is None:
+            self.face_encoding_bin = None
+            self.face_encoding_format = self.ENCODING_FORMAT_NONE
+        else:
+            self.face_encoding_bin = np.asarray(encoding, dtype=np.float32).tobytes()
+            self.face_encoding_format = self.ENCODING_FORMAT_FLOAT32
+        self.face_encoding = ''
+
     def clean(self):
         """Validate that the linked user has role 'employee'."""
         super().clean()
@@ -34,25 +96,25 @@ class Employee(models.Model):
         if self.user.role != 'employee':
             raise ValidationError({'user': 'Only users with role "employee" can be added as Employee.'})
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, compute_encoding=True, **kwargs):
+        """Save, computing the face encoding inline unless compute_encoding=False (see EnrollmentJob)."""
         # Validate before saving
         self.clean()
-        
-        # Import inside save to avoid errors during migrations
-        import face_recognition
 
-        if self.image and not self.face_encoding:
-            # Open image
-            img = Image.open(self.image)
-            img = np.array(img)
+        if compute_encoding and self.image and not self.has_encoding:
+            # Import inside save to avoid errors during migrations
+            from .encoding_cache import get_or_compute
+            from .recognition import encode_image
+
+            self.image.open('rb')
+            img_bytes = self.image.read()
 
-            # Detect face encoding
-            encodings = face_recognition.face_encodings(img)
+            # Detect face encoding, reusing a cached result for identical image bytes
+            encodings = get_or_compute(img_bytes, encode_image)
             if encodings:
-                # Convert numpy array to base64 string
-                self.face_encoding = base64.b64encode(encodings[0].tobytes()).decode('utf-8')
+                self.set_encoding(encodings[0])
             else:
-                self.face_encoding = ''  # No face detected
+                self.set_encoding(None)  # No face detected
 
         super().save(*args, **kwargs)
     
@@ -61,6 +123,117 @@ class Employee(models.Model):
 
 
 
+class FaceTemplate(models.Model):
+    """Additional face encoding of an employee (e.g. another angle or lighting).
+
+    The gallery matches a probe against the employee's primary encoding and all
+    of their templates and keeps the smallest distance (see core.gallery).
+    """
+    employee = models.ForeignKey('Employee', on_delete=models.CASCADE, related_name='face_templates')
+    image = models.ImageField(upload_to='employee_images/', blank=True)
+    encoding = models.BinaryField()  # float32[128]
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.employee} - template {self.pk}"
+
+    def get_encoding(self):
+        return np.frombuffer(self.encoding, dtype=np.float32)
+
+    @classmethod
+    def add(cls, employee, encoding, image=None):
+        """Store a new template, dropping the oldest ones beyond FACE_TEMPLATES_MAX."""
+        # One transaction, so the gallery is rebuilt once for the insert and the pruning
+        with transaction.atomic():
+            template = cls.objects.create(
+                employee=employee,
+                encoding=np.asarray(encoding, dtype=np.float32).tobytes(),
+                image=image or '',
+            )
+            stale = employee.face_templates.order_by('-created_at', '-pk').values_list('pk', flat=True)[settings.FACE_TEMPLATES_MAX:]
+            cls.objects.filter(pk__in=list(stale)).delete()
+        return template
+
+
+class EnrollmentJob(models.Model):
+    """Background face enrollment: the encoding for ``image`` is computed by the
+    ``run_enrollment_worker`` command and then stored on the employee, or added
+    as an extra FaceTemplate when ``add_template`` is set."""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    employee = models.ForeignKey('Employee', on_delete=models.CASCADE, related_name='enrollment_jobs')
+    image = models.ImageField(upload_to='employee_images/')
+    add_template = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.employee} - {self.status}"
+
+    @classmethod
+    def enqueue(cls, employee, image, add_template=False):
+        """Queue an enrollment for employee; ``image`` is an uploaded file or an existing storage name."""
+        return cls.objects.create(employee=employee, image=image, add_template=add_template)
+
+
+class EncodingCacheEntry(models.Model):
+    """Face encodings keyed by a hash of the image bytes and the encoder version (see core.encoding_cache)."""
+    content_hash = models.CharField(max_length=64)
+    encoder_version = models.CharField(max_length=100)
+    encodings = models.BinaryField(blank=True)  # float32[face_count, 128]
+    face_count = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_hash', 'encoder_version'], name='unique_encoding_cache_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.face_count} faces)"
+
+    def get_encodings(self):
+        return list(np.frombuffer(self.encodings, dtype=np.float32).reshape(self.face_count, 128))
+
+
+class GalleryVersion(models.Model):
+    """Single row counting face gallery changes, so every process notices them (see core.gallery).
+
+    Only used when FACE_GALLERY_SNAPSHOT_ENABLED is off; the snapshot file plays this role otherwise.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(version=models.F('version') + 1):
+            cls.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
 class Attendance(models.Model):
     """Legacy attendance model - kept for backward compatibility. New records should use attendenceapp.AttendanceLog"""
     employee = models.ForeignKey('Employee', on_delete=models.CASCADE)
@@ -69,9 +242,33 @@ class Attendance(models.Model):
 
     def __str__(self):
         return f"{self.employee.name} - {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
-    
-    
-    
+
+
+class AttendanceCompat(models.Model):
+    """Read-only stand-in for the legacy Attendance table, backed by a DB view over AttendanceLog.
+
+    Same fields as Attendance, so old readers can switch models (or query the
+    core_attendance_compat view directly) and keep working once
+    ATTENDANCE_LEGACY_DUAL_WRITE is turned off. Ids are AttendanceLog ids.
+    """
+    employee = models.ForeignKey('Employee', on_delete=models.DO_NOTHING)
+    timestamp = models.DateTimeField()
+    attendance_log = models.ForeignKey('attendenceapp.AttendanceLog', on_delete=models.DO_NOTHING, related_name='+')
+
+    class Meta:
+        managed = False
+        db_table = 'core_attendance_compat'
+
+    def __str__(self):
+        return f"{self.employee.name} - {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
+
+    def save(self, *args, **kwargs):
+        raise PermissionDenied('AttendanceCompat is read-only; create check-ins with AttendanceLog.create_checkin')
+
+    def delete(self, *args, **kwargs):
+        raise PermissionDenied('AttendanceCompat is read-only; delete the AttendanceLog instead')
+
+
 
 class SiteSettings(models.Model):
     site_name = models.CharField(max_length=150, default="VisionTrack")
@@ -0,0 +1,15 @@
+from rest_framework.parsers import BaseParser
+
+
+class RawImageParser(BaseParser):
+    """Raw image request bodies (image/jpeg, image/png, ...) parsed to the body bytes, without base64 or JSON."""
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return b''
+        return stream.read()
+
+
+class OctetStreamParser(RawImageParser):
+    media_type = 'application/octet-stream'
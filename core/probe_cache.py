@@ -0,0 +1,97 @@
+"""Short-lived cache of recent probe matches.
+
+A person standing in front of a kiosk produces a stream of near-identical
+probe encodings. A probe within ``PROBE_CACHE_RADIUS`` of one seen less than
+``PROBE_CACHE_TTL`` seconds ago gets the earlier match back without a gallery
+scan: the employee id and a bound on its distance to that employee (the
+earlier distance plus how far the probe moved). The caller only accepts the
+match when the bound, or failing that the exact distance to that employee, is
+under the match threshold. Only matches are cached, never
+responses: whether the employee is checked in, already marked or outside the
+shift is decided again for every frame. The cache is process-local and bounded to
+``PROBE_CACHE_SIZE`` entries (least recently used evicted first). Entries are
+keyed by location (see core/locations.py) so a match made against one
+location's employees is never reused by a kiosk of another location.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .gallery import ENCODING_SIZE
+
+
+def _location_key(scope):
+    return scope.location_id if scope is not None else 0
+
+
+class ProbeResultCache:
+    def __init__(self, size, ttl, radius):
+        self.size = size
+        self.ttl = ttl
+        self.radius = radius
+        self._lock = threading.Lock()
+        self._encodings = np.zeros((size, ENCODING_SIZE), dtype=np.float32)
+        self._expires = np.zeros(size)  # monotonic deadline per slot, 0 = empty
+        self._last_used = np.zeros(size)
+        self._locations = np.zeros(size, dtype=np.int64)  # location id of the scope, 0 = whole gallery
+        self._results = [None] * size
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, encoding, scope=None):
+        """``(employee_id, distance bound)`` cached for a probe close to ``encoding`` under the same scope, or None.
+
+        By the triangle inequality ``encoding`` is at most ``distance bound`` away from the employee.
+        """
+        if not self.size:
+            return None
+        now = time.monotonic()
+        encoding = np.asarray(encoding, dtype=np.float32)
+        with self._lock:
+            live = (self._expires > now) & (self._locations == _location_key(scope))
+            if live.any():
+                distances = np.linalg.norm(self._encodings - encoding, axis=1)
+                distances[~live] = np.inf
+                slot = int(np.argmin(distances))
+                if distances[slot] < self.radius:
+                    self._last_used[slot] = now
+                    self.hits += 1
+                    employee_id, distance = self._results[slot]
+                    return employee_id, distance + float(distances[slot])
+            self.misses += 1
+            return None
+
+    def put(self, encoding, result, scope=None):
+        if not self.size:
+            return
+        now = time.monotonic()
+        with self._lock:
+            expired = np.flatnonzero(self._expires <= now)
+            slot = int(expired[0]) if len(expired) else int(np.argmin(self._last_used))
+            self._encodings[slot] = encoding
+            self._expires[slot] = now + self.ttl
+            self._last_used[slot] = now
+            self._locations[slot] = _location_key(scope)
+            self._results[slot] = result
+
+    def clear(self):
+        with self._lock:
+            self._expires[:] = 0
+            self._results = [None] * self.size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+probe_cache = ProbeResultCache(
+    size=settings.PROBE_CACHE_SIZE,
+    ttl=settings.PROBE_CACHE_TTL,
+    radius=settings.PROBE_CACHE_RADIUS,
+)
@@ -0,0 +1,79 @@
+"""Scalar int8 quantization of the face gallery.
+
+Each dimension d is stored as ``x[d] ~= offset[d] + scale[d] * code[d]`` with
+``code`` in [-127, 127], so the gallery takes 128 bytes per encoding instead
+of 512. Approximate distances are computed chunk by chunk without ever
+materialising the full float matrix.
+
+Rounding moves every encoding by at most ``error_bound`` (half a quantization
+step per dimension), so an approximate distance is within ``error_bound`` of
+the exact one. ``FaceGallery`` uses that bound to pick which rows to re-rank
+exactly, which keeps accept/reject decisions identical to the float32
+gallery.
+"""
+import copy
+
+import numpy as np
+
+from .gallery import ENCODING_SIZE
+
+CODE_MAX = 127
+SCAN_CHUNK_ROWS = 8192
+
+
+class QuantizedEncodings:
+    def __init__(self, codes, offset, scale):
+        self.codes = np.ascontiguousarray(codes, dtype=np.int8).reshape(-1, ENCODING_SIZE)
+        self.offset = np.asarray(offset, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        # ||scale * code||^2 per row, the probe-independent part of the squared distance
+        self.code_norms = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), SCAN_CHUNK_ROWS):
+            chunk = self.codes[start:start + SCAN_CHUNK_ROWS].astype(np.float32) * self.scale
+            self.code_norms[start:start + len(chunk)] = np.einsum('ij,ij->i', chunk, chunk)
+        # Max distance between an encoding and its quantized value, plus slack for float32 rounding
+        self.error_bound = float(0.5 * np.linalg.norm(self.scale)) + 1e-4
+
+    def __len__(self):
+        return len(self.codes)
+
+    def slice(self, start, end):
+        """Rows start:end, sharing this object's arrays."""
+        part = copy.copy(self)
+        part.codes = self.codes[start:end]
+        part.code_norms = self.code_norms[start:end]
+        return part
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.code_norms.nbytes
+
+    @classmethod
+    def from_encodings(cls, encodings):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if not len(encodings):
+            return cls(np.empty((0, ENCODING_SIZE), dtype=np.int8), np.zeros(ENCODING_SIZE), np.zeros(ENCODING_SIZE))
+
+        low = encodings.min(axis=0)
+        high = encodings.max(axis=0)
+        offset = (low + high) / 2
+        scale = (high - low) / (2 * CODE_MAX)
+        scale[scale == 0] = 1.0  # constant dimension: every code is 0
+
+        codes = np.empty(encodings.shape, dtype=np.int8)
+        for start in range(0, len(encodings), SCAN_CHUNK_ROWS):
+            chunk = encodings[start:start + SCAN_CHUNK_ROWS]
+            codes[start:start + len(chunk)] = np.clip(np.rint((chunk - offset) / scale), -CODE_MAX, CODE_MAX)
+        return cls(codes, offset, scale)
+
+    def distances(self, probe):
+        """Approximate euclidean distance from ``probe`` to every row."""
+        residual = np.asarray(probe, dtype=np.float32) - self.offset
+        weights = residual * self.scale
+        # ||r - s*c||^2 = ||r||^2 - 2 (r*s).c + ||s*c||^2
+        dots = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), SCAN_CHUNK_ROWS):
+            chunk = self.codes[start:start + SCAN_CHUNK_ROWS]
+            dots[start:start + len(chunk)] = chunk.astype(np.float32) @ weights
+        squared = float(residual @ residual) - 2.0 * dots + self.code_norms
+        return np.sqrt(np.maximum(squared, 0.0))
@@ -0,0 +1,171 @@
+"""Decode/detect/encode pipeline for kiosk probe frames.
+
+Full-resolution kiosk frames make decoding and HOG detection the dominant
+per-request cost. Probe frames are therefore:
+
+* decoded with JPEG DCT-domain reduction (``IMREAD_REDUCED_COLOR_*``) while
+  the long side stays >= ``FACE_PROBE_DECODE_SIDE``;
+* searched for faces on a copy downscaled to ``FACE_PROBE_DETECT_SIDE``;
+* encoded from the decoded image using the detected boxes mapped back to its
+  coordinates, so the 128-d encoding still sees an adequately sized face.
+
+Setting either size to 0 disables that step.
+"""
+import io
+import time
+
+import cv2
+import face_recognition
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def _decode_flag(img_bytes, target_side):
+    """Largest reduction that keeps the decoded long side >= target_side."""
+    if not target_side:
+        return cv2.IMREAD_COLOR
+    try:
+        # Only parses the header, the pixels are decoded by OpenCV below
+        with Image.open(io.BytesIO(img_bytes)) as im:
+            long_side = max(im.size)
+    except Exception:
+        return cv2.IMREAD_COLOR
+
+    for factor, flag in _REDUCED_DECODE_FLAGS:
+        if long_side // factor >= target_side:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_probe(img_bytes):
+    """Decode an encoded image to an RGB array at capped resolution, or None if undecodable."""
+    nparr = np.frombuffer(img_bytes, np.uint8)
+    img = cv2.imdecode(nparr, _decode_flag(img_bytes, settings.FACE_PROBE_DECODE_SIDE))
+    if img is None:
+        return None
+    # Convert to RGB for face_recognition
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def locate_faces(rgb_img):
+    """HOG face boxes (top, right, bottom, left) in ``rgb_img`` coordinates, detected on a downscaled copy."""
+    height, width = rgb_img.shape[:2]
+    detect_side = settings.FACE_PROBE_DETECT_SIDE
+    scale = detect_side / max(height, width) if detect_side else 1.0
+    if scale >= 1.0:
+        return face_recognition.face_locations(rgb_img)
+
+    small = cv2.resize(rgb_img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    locations = []
+    for top, right, bottom, left in face_recognition.face_locations(small):
+        locations.append((
+            max(0, int(top / scale)),
+            min(width, int(round(right / scale))),
+            min(height, int(round(bottom / scale))),
+            max(0, int(left / scale)),
+        ))
+    return locations
+
+
+def probe_encodings(rgb_img):
+    """Encodings of every face in a probe frame, in detection order."""
+    locations = locate_faces(rgb_img)
+    if not locations:
+        return []
+    return face_recognition.face_encodings(rgb_img, known_face_locations=locations)
+
+
+def decode_image(img_bytes):
+    """Decode an encoded image to a full-resolution RGB array, or None if undecodable."""
+    nparr = np.frombuffer(img_bytes, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+# Task entry points for core.executor: bytes in, picklable results out.
+
+def warm_up_models():
+    """Run detection and encoding once on a blank frame so the dlib models are loaded and touched."""
+    blank = np.zeros((64, 64, 3), dtype=np.uint8)
+    face_recognition.face_locations(blank)
+    face_recognition.face_encodings(blank, known_face_locations=[(0, 64, 64, 0)])
+    return True
+
+
+def encode_probe(img_bytes):
+    """Probe frame bytes -> list of encodings, or None if the image cannot be decoded."""
+    return encode_probe_timed(img_bytes)[0]
+
+
+def encode_probe_timed(img_bytes):
+    """encode_probe plus the seconds spent in each step: ``(encodings, {'decode': ..., 'detect': ..., 'encode': ...})``."""
+    timings = {}
+    started = time.monotonic()
+    rgb_img = decode_probe(img_bytes)
+    timings['decode'] = time.monotonic() - started
+    if rgb_img is None:
+        return None, timings
+
+    started = time.monotonic()
+    locations = locate_faces(rgb_img)
+    timings['detect'] = time.monotonic() - started
+    if not locations:
+        return [], timings
+
+    started = time.monotonic()
+    encodings = face_recognition.face_encodings(rgb_img, known_face_locations=locations)
+    timings['encode'] = time.monotonic() - started
+    return encodings, timings
+
+
+def encode_chips_timed(chips):
+    """Pre-cropped faces -> one encoding per chip (None if undecodable), plus step timings.
+
+    ``chips`` is a list of ``(img_bytes, box)``; ``box`` is the face location
+    (top, right, bottom, left) inside the chip, or None for the whole chip; a
+    box that is empty once clamped to the chip counts as undecodable.
+    Detection is skipped entirely.
+    """
+    timings = {'decode': 0.0, 'encode': 0.0}
+    encodings = []
+    for img_bytes, box in chips:
+        started = time.monotonic()
+        rgb_img = decode_image(img_bytes)
+        timings['decode'] += time.monotonic() - started
+        if rgb_img is None:
+            encodings.append(None)
+            continue
+
+        height, width = rgb_img.shape[:2]
+        if box is None:
+            location = (0, width, height, 0)
+        else:
+            top, right, bottom, left = box
+            location = (max(0, top), min(width, right), min(height, bottom), max(0, left))
+            if location[1] <= location[3] or location[2] <= location[0]:
+                # Empty once clamped to the chip (inverted or entirely outside it): treat as undecodable
+                encodings.append(None)
+                continue
+        started = time.monotonic()
+        encodings.append(face_recognition.face_encodings(rgb_img, known_face_locations=[location])[0])
+        timings['encode'] += time.monotonic() - started
+    return encodings, timings
+
+
+def encode_image(img_bytes):
+    """Enrollment photo bytes -> list of encodings at full resolution, or None if undecodable."""
+    rgb_img = decode_image(img_bytes)
+    if rgb_img is None:
+        return None
+    return face_recognition.face_encodings(rgb_img)
+
+
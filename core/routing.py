@@ -0,0 +1,7 @@
+from django.urls import path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/attendance/', consumers.KioskConsumer.as_asgi(), name='kiosk-attendance-ws'),
+]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import SiteSettings, Feature, Step, Employee
+from .models import SiteSettings, Feature, Step, Employee, EnrollmentJob
 from user.models import User
 from django.conf import settings
 
@@ -91,7 +91,12 @@ class EmployeeCreateSerializer(serializers.Serializer):
         employee = Employee(user=user)
         if photo:
             employee.image = photo
-        employee.save()
+        if photo and settings.ENROLLMENT_ASYNC:
+            # Face encoding is computed in the background by the enrollment worker
+            employee.save(compute_encoding=False)
+            EnrollmentJob.enqueue(employee, employee.image.name)
+        else:
+            employee.save()
 
         return employee
 
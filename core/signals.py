@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Device, Employee, FaceTemplate, Location
+from .gallery import refresh_gallery
+from .probe_cache import probe_cache
+from .locations import device_scopes
+
+
+def encodings_changed():
+    refresh_gallery()
+    # Cached probe matches may refer to an employee that was just removed
+    probe_cache.clear()
+
+
+def schedule_encodings_changed():
+    """Run encodings_changed once the current transaction commits, however many changes it holds."""
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(func is encodings_changed for _, func, _ in connection.run_on_commit):
+        return
+    transaction.on_commit(encodings_changed)
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def employee_changed(sender, instance, **kwargs):
+    """Rebuild the face gallery once the employee change is committed."""
+    schedule_encodings_changed()
+
+
+@receiver(post_save, sender=FaceTemplate)
+@receiver(post_delete, sender=FaceTemplate)
+def face_template_changed(sender, instance, **kwargs):
+    schedule_encodings_changed()
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def device_changed(sender, instance, **kwargs):
+    """A kiosk moved, was deactivated or removed: drop the cached device scopes."""
+    transaction.on_commit(device_scopes.clear)
+
+
+@receiver(post_save, sender=Location)
+def location_changed(sender, instance, **kwargs):
+    """fallback_to_global may have changed, which changes cached matches too."""
+    def clear():
+        device_scopes.clear()
+        probe_cache.clear()
+    transaction.on_commit(clear)
+
+
+@receiver(post_delete, sender=Location)
+def location_deleted(sender, instance, **kwargs):
+    """SET_NULL unassigns the employees without Employee signals, so rebuild the gallery here."""
+    transaction.on_commit(device_scopes.clear)
+    schedule_encodings_changed()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    """Activating/deactivating a user adds or removes them from the gallery."""
+    if update_fields is not None and 'is_active' not in update_fields:
+        return
+    if instance.role != 'employee':
+        return
+    schedule_encodings_changed()
@@ -0,0 +1,117 @@
+"""Fixed-layout gallery snapshot file shared by all gunicorn workers.
+
+Layout (little endian)::
+
+    header     magic (8s) | version (u64) | count (u64) | dim (u32) | pad (4)
+    encodings  float32[count, dim]
+    employee   int64[count]
+    user       int64[count]
+    location   int64[count]   (0 = no location)
+
+The file is always replaced atomically (write to a temp file, then
+``os.replace``), so readers can ``np.memmap`` it without locking. Every worker
+maps the same file, so the encodings live once in the page cache instead of
+once per process. A worker notices a new snapshot by its changed inode/mtime.
+
+Writers serialise on ``snapshot_lock()`` (an flock on ``<path>.lock``) around
+reading the gallery from the DB and replacing the file, so a writer holding
+an older DB state can never replace a newer snapshot, and versions are unique.
+"""
+import fcntl
+import os
+import struct
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+
+MAGIC = b'VTGALv2\x00'
+HEADER = struct.Struct('<8sQQI4x')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_stamp(path):
+    """Cheap identity of the current snapshot file, or None if there is none."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def read_version(path):
+    """Version of the snapshot at path; 0 if it is missing or in another format."""
+    try:
+        with open(path, 'rb') as f:
+            magic, version, _, _ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return 0
+    return version if magic == MAGIC else 0
+
+
+@contextmanager
+def snapshot_lock(path):
+    """Exclusive lock shared by every process writing the snapshot at ``path``."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_snapshot(path, encodings, employee_ids, user_ids, location_ids):
+    """Atomically replace the snapshot at ``path``; returns the new version.
+
+    Callers that derive the contents from shared state hold ``snapshot_lock(path)``.
+    """
+    encodings = np.ascontiguousarray(encodings, dtype='<f4')
+    count, dim = encodings.shape
+    version = read_version(path) + 1
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, version, count, dim))
+            f.write(encodings.tobytes())
+            f.write(np.asarray(employee_ids, dtype='<i8').tobytes())
+            f.write(np.asarray(user_ids, dtype='<i8').tobytes())
+            f.write(np.asarray(location_ids, dtype='<i8').tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return version
+
+
+def open_snapshot(path):
+    """Map the snapshot read-only; returns ``(version, encodings, employee_ids, user_ids, location_ids)`` as zero-copy views."""
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    if len(data) < HEADER.size:
+        raise SnapshotError(f'{path} is truncated')
+    magic, version, count, dim = HEADER.unpack(data[:HEADER.size].tobytes())
+    if magic != MAGIC:
+        raise SnapshotError(f'{path} is not a gallery snapshot')
+
+    enc_end = HEADER.size + count * dim * 4
+    emp_end = enc_end + count * 8
+    user_end = emp_end + count * 8
+    location_end = user_end + count * 8
+    if len(data) != location_end:
+        raise SnapshotError(f'{path} has unexpected size')
+
+    encodings = data[HEADER.size:enc_end].view('<f4').reshape(count, dim)
+    employee_ids = data[enc_end:emp_end].view('<i8')
+    user_ids = data[emp_end:user_end].view('<i8')
+    location_ids = data[user_end:location_end].view('<i8')
+    return version, encodings, employee_ids, user_ids, location_ids
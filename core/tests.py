@@ -1,3 +1,575 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+from channels.testing import WebsocketCommunicator
+from django.core.exceptions import PermissionDenied
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from attendenceapp.models import AttendanceLog, AttendanceSettings
+from user.models import User
+
+from .consumers import KioskConsumer
+from .enrollment import claim_next_job, process_job
+from .frame_dedup import FrameDeduplicator, frame_dedup, frame_hash
+from .gallery import ENCODING_SIZE, FaceGallery, get_gallery, invalidate_gallery, publish_snapshot
+from .locations import device_scopes
+from .metrics import StageTimer
+from .models import Attendance, AttendanceCompat, EnrollmentJob, Employee, FaceTemplate, GalleryVersion
+from .probe_cache import ProbeResultCache, probe_cache
+from .signals import encodings_changed
+from .views import FaceRecognitionAttendanceView
+from .snapshot import open_snapshot, read_version, write_snapshot
+
+THRESHOLD = 0.48
+FACE = b'face frame'
+
+
+def unit_vectors(count, seed):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, ENCODING_SIZE)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_employee(username, encoding=None):
+    user = User(username=username, email=f'{username}@example.com', first_name=username.title(), role=User.EMPLOYEE)
+    user.save(force_insert=True)
+    employee = Employee(user=user)
+    if encoding is not None:
+        employee.set_encoding(encoding)
+    employee.save(compute_encoding=False)
+    return employee
+
+
+def nearby(vectors, seed, noise=0.02):
+    rng = np.random.default_rng(seed)
+    offsets = rng.standard_normal(vectors.shape).astype(np.float32)
+    return vectors + offsets * (noise / np.linalg.norm(offsets, axis=1, keepdims=True))
+
+
+def jpeg(pixels, quality=90):
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+class GalleryEquivalenceTests(SimpleTestCase):
+    """The quantized and IVF galleries must take the decisions of the exact scan."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.encodings = unit_vectors(2000, seed=0)
+        cls.ids = np.arange(1, len(cls.encodings) + 1)
+        cls.exact = FaceGallery(cls.encodings, cls.ids, cls.ids)
+        rows = np.random.default_rng(1).integers(0, len(cls.encodings), 50)
+        # Half the probes are close to an enrolled face, half are strangers
+        cls.probes = np.concatenate([nearby(cls.encodings[rows], seed=2), unit_vectors(50, seed=3)])
+
+    def decisions(self, gallery):
+        decisions = []
+        for probe in self.probes:
+            employee_id, distance = gallery.best_match(probe, THRESHOLD)
+            decisions.append((employee_id, round(distance, 5)) if distance < THRESHOLD else None)
+        return decisions
+
+    def test_quantized_matches_exact(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'gallery.bin')
+            write_snapshot(path, self.encodings, self.ids, self.ids, np.zeros(len(self.ids)))
+            quantized = FaceGallery.from_snapshot(path)
+            quantized.quantize(rerank=8)
+            self.assertIsNone(quantized.encodings)
+            self.assertEqual(self.decisions(quantized), self.decisions(self.exact))
+
+    def test_quantized_location_partition_matches_exact(self):
+        locations = self.ids % 4 + 1
+        exact = FaceGallery(self.encodings, self.ids, self.ids, locations).for_location(2)
+        quantized = FaceGallery(self.encodings, self.ids, self.ids, locations)
+        quantized.quantize(rerank=8)
+        self.assertEqual(self.decisions(quantized.for_location(2)), self.decisions(exact))
+
+    def test_ivf_matches_exact(self):
+        indexed = FaceGallery(self.encodings, self.ids, self.ids)
+        self.assertTrue(indexed.build_index(n_probe=8))
+        self.assertEqual(self.decisions(indexed)[:50], self.decisions(self.exact)[:50])
+
+        # Probing every list is an exact scan
+        indexed.n_probe = len(indexed.index.centroids)
+        self.assertEqual(self.decisions(indexed), self.decisions(self.exact))
+
+
+class SnapshotTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'gallery.bin')
+
+    def test_round_trip(self):
+        encodings = unit_vectors(5, seed=0)
+        self.assertEqual(write_snapshot(self.path, encodings, [3, 1, 4, 1, 5], [9, 2, 6, 2, 5], [0, 1, 1, 0, 2]), 1)
+        version, mapped, employee_ids, user_ids, location_ids = open_snapshot(self.path)
+        self.assertEqual(version, 1)
+        np.testing.assert_array_equal(mapped, encodings)
+        self.assertEqual(employee_ids.tolist(), [3, 1, 4, 1, 5])
+        self.assertEqual(user_ids.tolist(), [9, 2, 6, 2, 5])
+        self.assertEqual(location_ids.tolist(), [0, 1, 1, 0, 2])
+        self.assertEqual(write_snapshot(self.path, encodings[:1], [3], [9], [0]), 2)
+        self.assertEqual(read_version(self.path), 2)
+
+    def test_workers_remap_a_replaced_snapshot(self):
+        write_snapshot(self.path, unit_vectors(1, seed=0), [1], [1], [0])
+        invalidate_gallery()
+        self.addCleanup(invalidate_gallery)
+        with override_settings(FACE_GALLERY_SNAPSHOT_PATH=self.path):
+            first = get_gallery()
+            self.assertIs(get_gallery(), first)
+            # Another process publishes a new gallery
+            write_snapshot(self.path, unit_vectors(2, seed=1), [1, 2], [1, 2], [0, 0])
+            second = get_gallery()
+        self.assertIsNot(second, first)
+        self.assertEqual(second.employee_ids.tolist(), [1, 2])
+        # The old mapping stays valid for matches still using it
+        self.assertEqual(first.best_match(unit_vectors(1, seed=0)[0])[0], 1)
+
+    def test_concurrent_publishers_write_unique_versions(self):
+        gallery = FaceGallery(unit_vectors(3, seed=0), [1, 2, 3], [1, 2, 3])
+        with mock.patch('core.gallery.FaceGallery.from_db', return_value=gallery):
+            with ThreadPoolExecutor(4) as executor:
+                versions = list(executor.map(lambda _: publish_snapshot(self.path), range(8)))
+        self.assertEqual(sorted(versions), list(range(1, 9)))
+
+
+class FrameDedupTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # A smooth scene: blocks of random brightness, like a kiosk background with a face in it
+        self.scene = np.kron(rng.uniform(40, 215, (8, 9)), np.ones((40, 40)))
+        self.frame = jpeg(self.scene)
+        self.dedup = FrameDeduplicator(max_devices=4, ttl=5.0, max_distance=4)
+        self.encodings = [unit_vectors(1, seed=0)[0]]
+
+    def test_near_duplicate_frame_reuses_the_encodings(self):
+        # Sensor noise and a different JPEG quality do not change the fingerprint much
+        noisy = self.scene + np.random.default_rng(1).normal(0, 3, self.scene.shape)
+        self.dedup.put('kiosk', frame_hash(self.frame), self.encodings)
+        self.assertIs(self.dedup.get('kiosk', frame_hash(jpeg(noisy, quality=70))), self.encodings)
+
+    def test_distinct_frame_is_encoded_again(self):
+        self.dedup.put('kiosk', frame_hash(self.frame), self.encodings)
+        self.assertIsNone(self.dedup.get('kiosk', frame_hash(jpeg(self.scene[:, ::-1]))))
+        # Nor does another device get this device's frame
+        self.assertIsNone(self.dedup.get('other kiosk', frame_hash(self.frame)))
+
+    def test_entry_expires_after_the_ttl(self):
+        with mock.patch('core.frame_dedup.time.monotonic', return_value=100.0):
+            self.dedup.put('kiosk', frame_hash(self.frame), self.encodings)
+        with mock.patch('core.frame_dedup.time.monotonic', return_value=104.9):
+            self.assertIs(self.dedup.get('kiosk', frame_hash(self.frame)), self.encodings)
+        with mock.patch('core.frame_dedup.time.monotonic', return_value=105.1):
+            self.assertIsNone(self.dedup.get('kiosk', frame_hash(self.frame)))
+
+    def test_undecodable_frame_has_no_fingerprint(self):
+        self.assertIsNone(frame_hash(b'not an image'))
+
+
+class GalleryLoadingTests(TestCase):
+    def setUp(self):
+        with override_settings(FACE_GALLERY_SNAPSHOT_ENABLED=False):
+            make_employee('ann', unit_vectors(1, seed=0)[0])
+        invalidate_gallery()
+        self.addCleanup(invalidate_gallery)
+
+    def test_unwritable_snapshot_falls_back_to_the_db_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            blocker = os.path.join(directory, 'not-a-directory')
+            open(blocker, 'w').close()
+            with override_settings(FACE_GALLERY_SNAPSHOT_PATH=os.path.join(blocker, 'gallery.bin')):
+                with self.assertLogs('core.gallery', 'WARNING'):
+                    self.assertEqual(len(get_gallery()), 1)
+                # The fallback is cached, not reloaded from the DB on every frame
+                with self.assertNumQueries(0):
+                    self.assertEqual(len(get_gallery()), 1)
+
+    def test_corrupt_snapshot_falls_back_to_the_db_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'gallery.bin')
+            write_snapshot(path, unit_vectors(1, seed=0), [1], [1], [0])
+            with open(path, 'ab') as f:
+                f.write(b'trailing garbage')
+            with override_settings(FACE_GALLERY_SNAPSHOT_PATH=path):
+                with self.assertLogs('core.gallery', 'WARNING'):
+                    self.assertEqual(len(get_gallery()), 1)
+                with self.assertNumQueries(0):
+                    get_gallery()
+
+
+@override_settings(FACE_GALLERY_SNAPSHOT_ENABLED=False)
+class GalleryVersionTests(TestCase):
+    def setUp(self):
+        make_employee('ann', unit_vectors(1, seed=0)[0])
+        invalidate_gallery()
+        self.addCleanup(invalidate_gallery)
+
+    def test_reloads_after_a_change_in_another_process(self):
+        first = get_gallery()
+        self.assertIs(get_gallery(), first)
+        # The other process commits an enrollment and bumps the version; our copy was never invalidated
+        with self.captureOnCommitCallbacks(execute=False):
+            make_employee('bob', unit_vectors(1, seed=1)[0])
+        self.assertIs(get_gallery(), first)
+        GalleryVersion.bump()
+        self.assertEqual(len(get_gallery()), 2)
+
+    def test_encodings_changed_bumps_the_version(self):
+        before = GalleryVersion.current()
+        encodings_changed()
+        self.assertEqual(GalleryVersion.current(), before + 1)
+
+
+@override_settings(FACE_GALLERY_SNAPSHOT_ENABLED=False)
+class EncodingsChangedTests(TransactionTestCase):
+    def setUp(self):
+        patcher = mock.patch('core.signals.encodings_changed')
+        self.encodings_changed = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_rebuild_per_transaction(self):
+        with transaction.atomic():
+            for i in range(3):
+                make_employee(f'user{i}', unit_vectors(1, seed=i)[0])
+        self.assertEqual(self.encodings_changed.call_count, 1)
+
+    @override_settings(FACE_TEMPLATES_MAX=1)
+    def test_template_at_the_cap_rebuilds_once(self):
+        employee = make_employee('ann', unit_vectors(1, seed=0)[0])
+        FaceTemplate.add(employee, unit_vectors(1, seed=1)[0])
+        self.encodings_changed.reset_mock()
+        FaceTemplate.add(employee, unit_vectors(1, seed=2)[0])
+        self.assertEqual(self.encodings_changed.call_count, 1)
+        self.assertEqual(employee.face_templates.count(), 1)
+
+    def test_rolled_back_changes_do_not_block_later_ones(self):
+        with transaction.atomic():
+            make_employee('ann', unit_vectors(1, seed=0)[0])
+            transaction.set_rollback(True)
+        with transaction.atomic():
+            make_employee('bob', unit_vectors(1, seed=1)[0])
+        self.assertEqual(self.encodings_changed.call_count, 1)
+
+
+@override_settings(
+    RECOGNITION_POOL_WORKERS=0,
+    FACE_GALLERY_SNAPSHOT_ENABLED=False,
+    FACE_GALLERY_QUANTIZED=False,
+    FACE_ANN_ENABLED=False,
+    CHECKIN_CACHE_TTL=0,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class KioskConsumerTests(TransactionTestCase):
+    def setUp(self):
+        AttendanceSettings.objects.create(pk=1, start_time=time(0), end_time=time(23, 59, 59))
+        user = User(username='ann', email='ann@example.com', first_name='Ann', last_name='Lee', role=User.EMPLOYEE)
+        user.save(force_insert=True)
+        self.employee = Employee(user=user)
+        self.encoding = unit_vectors(1, seed=0)[0]
+        self.employee.set_encoding(self.encoding)
+        self.employee.save(compute_encoding=False)
+
+        for cache in (probe_cache, frame_dedup, device_scopes):
+            cache.clear()
+        invalidate_gallery()
+
+        # Detection and encoding are stubbed: FACE holds the employee's face, anything else is undecodable
+        patcher = mock.patch(
+            'core.views.encode_probe_frame',
+            side_effect=lambda img_bytes, timer: [self.encoding] if img_bytes == FACE else None,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        invalidate_gallery()
+
+    async def connect(self, path='/ws/attendance/'):
+        communicator = WebsocketCommunicator(KioskConsumer.as_asgi(), path)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_recognizes_and_checks_in(self):
+        communicator = await self.connect()
+        await communicator.send_to(bytes_data=FACE)
+        result = await communicator.receive_json_from(timeout=10)
+        self.assertEqual(result['type'], 'result')
+        self.assertEqual((result['frame'], result['dropped'], result['httpStatus']), (1, 0, 200))
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['data']['employeeId'], str(self.employee.user_id))
+
+        await communicator.send_to(bytes_data=FACE)
+        result = await communicator.receive_json_from(timeout=10)
+        self.assertEqual(result['frame'], 2)
+        self.assertTrue(result['data']['alreadyMarked'])
+        await communicator.disconnect()
+        self.assertEqual(await AttendanceLog.objects.acount(), 1)
+
+    async def test_results_reach_every_socket_of_the_device(self):
+        camera = await self.connect('/ws/attendance/?device=kiosk-1')
+        display = await self.connect('/ws/attendance/?device=kiosk-1')
+        await camera.send_to(bytes_data=FACE)
+        for communicator in (camera, display):
+            result = await communicator.receive_json_from(timeout=10)
+            self.assertEqual(result['status'], 'success')
+            await communicator.disconnect()
+
+    async def test_superseded_frames_are_dropped(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_recognize(img_bytes, group, device_id):
+            started.set()
+            release.wait(10)
+            return {'status': 'success', 'message': img_bytes.decode()}, 200
+
+        with mock.patch('core.consumers.recognize_frame', slow_recognize):
+            communicator = await self.connect()
+            await communicator.send_to(bytes_data=b'1')
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 10)
+            # Frames 2 and 3 arrive while frame 1 is being recognised: only the newest is kept
+            await communicator.send_to(bytes_data=b'2')
+            await communicator.send_to(bytes_data=b'3')
+            await communicator.receive_nothing(0.2)
+            release.set()
+
+            first = await communicator.receive_json_from(timeout=10)
+            second = await communicator.receive_json_from(timeout=10)
+            await communicator.disconnect()
+        # Frame 2 was skipped before the first result went out
+        self.assertEqual((first['frame'], first['dropped'], first['message']), (1, 1, '1'))
+        self.assertEqual((second['frame'], second['dropped'], second['message']), (3, 0, '3'))
+
+    @override_settings(WS_FRAME_MAX_AGE=0)
+    async def test_stale_frames_are_dropped(self):
+        with mock.patch('core.consumers.recognize_frame') as recognize:
+            communicator = await self.connect()
+            await communicator.send_to(bytes_data=FACE)
+            self.assertTrue(await communicator.receive_nothing(0.3))
+            await communicator.disconnect()
+        recognize.assert_not_called()
+
+    async def test_undecodable_frame(self):
+        communicator = await self.connect()
+        await communicator.send_to(bytes_data=b'not an image')
+        result = await communicator.receive_json_from(timeout=10)
+        await communicator.disconnect()
+        self.assertEqual((result['httpStatus'], result['status']), (400, 'error'))
+        self.assertEqual(result['message'], 'Unable to decode image')
+
+    @override_settings(WS_FRAME_MAX_BYTES=4)
+    async def test_oversized_frame(self):
+        communicator = await self.connect()
+        await communicator.send_to(bytes_data=FACE)
+        result = await communicator.receive_json_from(timeout=10)
+        self.assertEqual(result, {'type': 'error', 'message': 'Frame larger than 4 bytes'})
+        self.assertTrue(await communicator.receive_nothing(0.2))
+        await communicator.disconnect()
+
+    async def test_bad_text_messages(self):
+        communicator = await self.connect()
+        for text in ('not json', json.dumps([1, 2])):
+            await communicator.send_to(text_data=text)
+            result = await communicator.receive_json_from(timeout=10)
+            self.assertEqual(result['type'], 'error')
+
+        # A valid options message is applied silently
+        await communicator.send_to(text_data=json.dumps({'group': True}))
+        self.assertTrue(await communicator.receive_nothing(0.2))
+        await communicator.send_to(bytes_data=FACE)
+        result = await communicator.receive_json_from(timeout=10)
+        await communicator.disconnect()
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['message'], 'Attendance marked for 1 of 1 faces')
+
+
+@override_settings(
+    FACE_GALLERY_SNAPSHOT_ENABLED=False,
+    FACE_GALLERY_QUANTIZED=False,
+    FACE_ANN_ENABLED=False,
+    CHECKIN_CACHE_TTL=0,
+)
+class ProbeCacheTests(TestCase):
+    def setUp(self):
+        AttendanceSettings.objects.create(pk=1, start_time=time(0), end_time=time(23, 59, 59))
+        self.encoding = unit_vectors(1, seed=0)[0]
+        self.employee = make_employee('ann', self.encoding)
+        # A direction away from the employee: probes along it move straight out of the match
+        away = unit_vectors(1, seed=1)[0]
+        away -= away.dot(self.encoding) * self.encoding
+        self.away = away / np.linalg.norm(away)
+        probe_cache.clear()
+        invalidate_gallery()
+        self.addCleanup(probe_cache.clear)
+        self.addCleanup(invalidate_gallery)
+
+    def match(self, probe):
+        view = FaceRecognitionAttendanceView()
+        return view.match_faces([probe], False, None, StageTimer('test')).data
+
+    def test_hit_returns_a_bound_on_the_distance(self):
+        cache = ProbeResultCache(size=4, ttl=60, radius=0.15)
+        cache.put(self.encoding, (self.employee.pk, 0.3))
+        employee_id, bound = cache.get(self.encoding + 0.1 * self.away)
+        self.assertEqual(employee_id, self.employee.pk)
+        self.assertAlmostEqual(bound, 0.4, places=5)
+
+    def test_hit_never_accepts_a_probe_beyond_the_threshold(self):
+        cached = self.encoding + 0.47 * self.away
+        probe_cache.put(cached, (self.employee.pk, 0.47))
+        # Within the cache radius of the cached probe, but 0.57 from the employee
+        probe = cached + 0.1 * self.away
+        self.assertIsNotNone(probe_cache.get(probe))
+        self.assertEqual(self.match(probe)['message'], 'No user found with this face')
+        self.assertFalse(AttendanceLog.objects.exists())
+
+    def test_hit_over_the_bound_is_checked_against_the_employee(self):
+        cached = self.encoding + 0.4 * self.away
+        probe_cache.put(cached, (self.employee.pk, 0.4))
+        # The bound (0.5) proves nothing, but the probe is really 0.3 from the employee
+        result = self.match(self.encoding + 0.3 * self.away)
+        self.assertEqual(result['status'], 'success')
+
+    def test_encodings_changed_clears_the_cache(self):
+        probe_cache.put(self.encoding, (self.employee.pk, 0.0))
+        encodings_changed()
+        self.assertIsNone(probe_cache.get(self.encoding))
+
+
+@override_settings(FACE_GALLERY_SNAPSHOT_ENABLED=False, ENROLLMENT_JOB_TIMEOUT=600)
+class EnrollmentJobTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+        self.employee = make_employee('ann')
+        self.encoding = unit_vectors(1, seed=0)[0]
+        # Detection and encoding are stubbed: the photo content says what the encoder finds
+        patcher = mock.patch(
+            'core.recognition.encode_image',
+            side_effect=lambda img_bytes: {b'face': [self.encoding], b'no face': []}.get(img_bytes.split(b':')[0]),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_job(self, content, **kwargs):
+        image = SimpleUploadedFile('ann.jpg', content + b':' + str(EnrollmentJob.objects.count()).encode())
+        return EnrollmentJob.objects.create(employee=self.employee, image=image, **kwargs)
+
+    def poll(self, job):
+        response = self.client.get(reverse('enrollment-job-status', args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_job_runs_from_pending_to_done(self):
+        job = self.make_job(b'face')
+        self.assertEqual(self.poll(job)['status'], EnrollmentJob.STATUS_PENDING)
+
+        claimed = claim_next_job()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(self.poll(job)['status'], EnrollmentJob.STATUS_RUNNING)
+        self.assertIsNone(claim_next_job())
+
+        process_job(claimed)
+        data = self.poll(job)
+        self.assertEqual(data['status'], EnrollmentJob.STATUS_DONE)
+        self.assertTrue(data['hasEncoding'])
+        self.assertIsNotNone(data['finishedAt'])
+        self.employee.refresh_from_db()
+        np.testing.assert_allclose(self.employee.get_encoding(), self.encoding)
+        self.assertEqual(self.employee.image.name, job.image.name)
+
+    def test_template_job_adds_a_face_template(self):
+        job = self.make_job(b'face', add_template=True)
+        process_job(claim_next_job())
+        self.assertEqual(self.poll(job)['status'], EnrollmentJob.STATUS_DONE)
+        self.assertEqual(self.employee.face_templates.count(), 1)
+        self.assertFalse(Employee.objects.get(pk=self.employee.pk).has_encoding)
+
+    def test_job_without_a_face_fails(self):
+        job = self.make_job(b'no face')
+        process_job(claim_next_job())
+        data = self.poll(job)
+        self.assertEqual(data['status'], EnrollmentJob.STATUS_FAILED)
+        self.assertIn('No face detected', data['message'])
+        self.assertFalse(data['hasEncoding'])
+
+    def test_undecodable_image_fails(self):
+        job = self.make_job(b'garbage')
+        process_job(claim_next_job())
+        self.assertEqual(self.poll(job)['message'], 'Unable to decode image')
+
+    def test_oldest_pending_job_is_claimed_first(self):
+        first = self.make_job(b'face')
+        self.make_job(b'face')
+        self.assertEqual(claim_next_job().pk, first.pk)
+
+    def test_stale_running_job_is_claimed_again(self):
+        job = self.make_job(b'face')
+        claim_next_job()
+        EnrollmentJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(seconds=601))
+        self.assertEqual(claim_next_job().pk, job.pk)
+
+    def test_unknown_job_is_not_found(self):
+        response = self.client.get(reverse('enrollment-job-status', args=['00000000-0000-0000-0000-000000000000']))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(FACE_GALLERY_SNAPSHOT_ENABLED=False)
+class AttendanceCompatTests(TestCase):
+    def setUp(self):
+        AttendanceSettings.objects.create(pk=1, start_time=time(0), end_time=time(23, 59, 59))
+        user = User(username='ann', email='ann@example.com', first_name='Ann', role=User.EMPLOYEE)
+        user.save(force_insert=True)
+        self.employee = Employee(user=user)
+        self.employee.save(compute_encoding=False)
+
+    def test_reads_checkins_from_attendance_log(self):
+        log, _ = AttendanceLog.create_checkin(self.employee.user)
+        Attendance.objects.create(employee=self.employee, timestamp=log.checkin_time, attendance_log=log)
+        rows = list(AttendanceCompat.objects.all())
+        self.assertEqual([(row.pk, row.employee_id, row.timestamp) for row in rows], [(log.pk, self.employee.pk, log.checkin_time)])
+
+    def test_history_keeps_the_legacy_attendance_id(self):
+        log, _ = AttendanceLog.create_checkin(self.employee.user)
+        legacy = Attendance.objects.create(employee=self.employee, timestamp=log.checkin_time, attendance_log=log)
+        # A check-in made with ATTENDANCE_LEGACY_DUAL_WRITE off has no legacy row
+        newer, _ = AttendanceLog.create_checkin(self.employee.user, log.checkin_time + timedelta(days=1))
+        response = self.client.post(
+            reverse('employee-attendance-history'), {'email': 'ANN@example.com'}, content_type='application/json',
+        )
+        rows = response.json()['results']['data']
+        self.assertEqual([(row['id'], row['attendanceLogId']) for row in rows], [(None, newer.pk), (legacy.pk, log.pk)])
+
+    def test_is_read_only(self):
+        log, _ = AttendanceLog.create_checkin(self.employee.user)
+        row = AttendanceCompat.objects.get()
+        with self.assertRaises(PermissionDenied):
+            row.save()
+        with self.assertRaises(PermissionDenied):
+            row.delete()
+        with self.assertRaises(PermissionDenied):
+            AttendanceCompat(employee=self.employee, timestamp=log.checkin_time, attendance_log=log).save()
+        self.assertTrue(AttendanceLog.objects.filter(pk=log.pk).exists())
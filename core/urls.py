@@ -1,6 +1,7 @@
 from django.urls import path
 from django.http import JsonResponse
 from . import views
+from .metrics import metrics_view
 
 def core_index(request):
     return JsonResponse({"message": "Hello from core API!"})
@@ -11,6 +12,7 @@ urlpatterns = [
     path('success/', views.upload_success, name='upload_success'),
     path('attendance/', views.mark_attendance, name='mark_attendance'),
     path("landing/", views.landing_page_data, name="landing-page-data"),
+    path('metrics/', metrics_view, name='metrics'),
     
     # Employee Management APIs (specific routes before parameterized ones)
     path('api/employees/', views.EmployeeListCreateView.as_view(), name='employee-list-create'),
@@ -18,7 +20,9 @@ urlpatterns = [
     path('api/employees/check/', views.EmployeeCheckView.as_view(), name='employee-check'),
     path('api/employees/upload/', views.EmployeeFaceUploadView.as_view(), name='employee-upload'),
     path('api/employees/attendance-history/', views.EmployeeAttendanceHistoryView.as_view(), name='employee-attendance-history'),
+    path('api/employees/enrollment-jobs/<uuid:pk>/', views.EnrollmentJobStatusView.as_view(), name='enrollment-job-status'),
     path('api/mark-attendance/', views.FaceRecognitionAttendanceView.as_view(), name='face-recognition-attendance'),
+    path('api/recognition/stats/', views.RecognitionStatsView.as_view(), name='recognition-stats'),
     path('api/user-role/', views.UserRoleCheckView.as_view(), name='user-role-check'),
     path('api/employees/<str:pk>/', views.EmployeeDetailView.as_view(), name='employee-detail'),
 ]
@@ -2,25 +2,35 @@ from django.shortcuts import render, redirect
 from .forms import EmployeeForm
 
 from django.http import JsonResponse
-from .models import Employee, Attendance
+from .models import Employee, Attendance, EnrollmentJob, FaceTemplate
+from .gallery import get_gallery
+from .frame_dedup import frame_dedup, frame_hash
+from .executor import run_recognition, RecognitionUnavailable
+from .encoding_cache import get_or_compute
+from .probe_cache import probe_cache
+from .locations import device_scopes
+from .metrics import timed_stages
 from attendenceapp.models import AttendanceSettings, AttendanceLog
-import cv2
-import numpy as np
+from attendenceapp.checkins import todays_checkins
 import base64
-import face_recognition
+import json
 from datetime import date, time, datetime
+from time import monotonic
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.conf import settings
+from django.utils.decorators import method_decorator
 
 
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
 from .models import SiteSettings, Feature, Step, Employee, Attendance
 from .serializers import (
     SiteSettingsSerializer, 
@@ -30,6 +40,7 @@ from .serializers import (
     EmployeeCreateSerializer,
     EmployeeStatusSerializer
 )
+from .parsers import RawImageParser, OctetStreamParser
 from attendenceapp.permissions import IsAdminOrSuperUser
 from rest_framework.permissions import AllowAny
 from django.core.files.uploadedfile import InMemoryUploadedFile
@@ -50,6 +61,184 @@ def upload_success(request):
 
 
 
+def run_timed_task(task, payload, timer):
+    """Run ``core.recognition.<task>(payload) -> (result, timings)`` in the recognition pool, recording its steps and queue time on timer."""
+    started = monotonic()
+    result, timings = run_recognition(task, payload)
+    for name, seconds in timings.items():
+        timer.add(name, seconds)
+    # Whatever the worker did not account for was spent waiting for (or travelling to) it
+    timer.add('queue', max(0.0, monotonic() - started - sum(timings.values())))
+    return result
+
+
+def encode_probe_frame(img_bytes, timer):
+    """Probe encodings computed in the recognition pool, recording decode/detect/encode and queue time on timer."""
+    return run_timed_task('encode_probe_timed', img_bytes, timer)
+
+
+def decode_data_url(img_data):
+    """Bytes of a base64 image, with or without a "data:image/...;base64," prefix."""
+    if ',' in img_data:
+        return base64.b64decode(img_data.split(',')[1])
+    return base64.b64decode(img_data)
+
+
+def find_best_match(unknown_encoding, threshold, scope=None):
+    """Return (employee, distance) for the closest gallery encoding under threshold, else (None, distance).
+
+    With a device scope (core.locations), the location's employees are searched
+    first and the whole gallery only if the location falls back to it.
+    """
+    gallery = get_gallery()
+    if scope is None:
+        employee_id, distance = gallery.best_match(unknown_encoding, threshold)
+    else:
+        employee_id, distance = gallery.for_location(scope.location_id).best_match(unknown_encoding, threshold)
+        if (employee_id is None or distance >= threshold) and scope.fallback_to_global:
+            employee_id, distance = gallery.best_match(unknown_encoding, threshold)
+    if employee_id is None or distance >= threshold:
+        return None, distance
+    return active_employee(employee_id), distance
+
+
+def active_employee(employee_id):
+    """The matched Employee (with its user), or None if the user was deactivated meanwhile."""
+    # Gallery may lag a just-deactivated user by one commit; re-check before matching
+    return Employee.objects.select_related('user').filter(pk=employee_id, user__is_active=True).first()
+
+
+def find_best_matches(unknown_encodings, threshold, scope=None):
+    """Batch find_best_match: one (employee or None, distance) per encoding, in order."""
+    gallery = get_gallery()
+    if scope is None:
+        matches = gallery.best_matches(unknown_encodings, threshold)
+    else:
+        matches = gallery.for_location(scope.location_id).best_matches(unknown_encodings, threshold)
+        unmatched = [i for i, (employee_id, distance) in enumerate(matches) if employee_id is None or distance >= threshold]
+        if unmatched and scope.fallback_to_global:
+            fallback = gallery.best_matches([unknown_encodings[i] for i in unmatched], threshold)
+            for i, match in zip(unmatched, fallback):
+                matches[i] = match
+    matched_ids = [employee_id for employee_id, distance in matches if employee_id is not None and distance < threshold]
+    employees = Employee.objects.select_related('user').filter(pk__in=matched_ids, user__is_active=True).in_bulk()
+
+    results = []
+    for employee_id, distance in matches:
+        if employee_id is None or distance >= threshold:
+            results.append((None, distance))
+        else:
+            results.append((employees.get(employee_id), distance))
+    return results
+
+
+def record_legacy_attendance(checkins):
+    """Mirror new check-ins, given as (employee, attendance_log) pairs, into the legacy Attendance table.
+
+    Skipped when ATTENDANCE_LEGACY_DUAL_WRITE is off.
+    """
+    if not settings.ATTENDANCE_LEGACY_DUAL_WRITE or not checkins:
+        return
+    if len(checkins) == 1:
+        # A plain insert; bulk_create would wrap it in a transaction of its own
+        employee, attendance_log = checkins[0]
+        Attendance.objects.create(employee=employee, timestamp=attendance_log.checkin_time, attendance_log=attendance_log)
+        return
+    Attendance.objects.bulk_create([
+        Attendance(employee=employee, timestamp=attendance_log.checkin_time, attendance_log=attendance_log)
+        for employee, attendance_log in checkins
+    ])
+
+
+def group_checkin(unknown_encodings, threshold, timer, scope=None):
+    """Check in every recognised face of one frame.
+
+    Faces are matched in one vectorized batch and all AttendanceLog/Attendance
+    rows are written in a single transaction. Returns one result dict per face,
+    in detection order.
+    """
+    with timer.stage('match'):
+        matches = find_best_matches(unknown_encodings, threshold, scope)
+
+    attendance_settings = AttendanceSettings.get_solo()
+    current_datetime = timezone.now()
+    local_datetime = timezone.localtime(current_datetime)
+    today = local_datetime.date()
+    start_dt = timezone.make_aware(datetime.combine(today, attendance_settings.start_time), timezone.get_current_timezone())
+    end_dt = timezone.make_aware(datetime.combine(today, attendance_settings.end_time), timezone.get_current_timezone())
+
+    # Memory answers repeat frames; a check-in made elsewhere is caught by the insert below. Outside the
+    # shift nothing is inserted, so the DB is asked directly to still answer "already marked".
+    outside_shift = local_datetime < start_dt or local_datetime > end_dt
+    with timer.stage('checkin_lookup'):
+        existing_logs = todays_checkins.get_many(
+            [employee.user_id for employee, _ in matches if employee], check_db=outside_shift,
+        )
+
+    results = []
+    to_checkin = []
+    for face_index, (employee, distance) in enumerate(matches):
+        if employee is None:
+            results.append({'faceIndex': face_index, 'status': 'error', 'message': 'No user found with this face'})
+            continue
+
+        result = {
+            'faceIndex': face_index,
+            'employeeId': str(employee.user.id),
+            'employeeName': employee.name,
+            'employeeEmail': employee.user.email,
+        }
+        existing_log = existing_logs.get(employee.user_id)
+        if existing_log:
+            result.update({
+                'status': 'error',
+                'message': f'{employee.name} already marked today',
+                'alreadyMarked': True,
+                'markedAt': existing_log.checkin_time.isoformat(),
+            })
+        elif local_datetime < start_dt:
+            result.update({'status': 'error', 'message': f'Too early! Shift starts at {attendance_settings.start_time.strftime("%I:%M %p")}'})
+        elif local_datetime > end_dt:
+            result.update({'status': 'error', 'message': f'You are late! Shift ended at {attendance_settings.end_time.strftime("%I:%M %p")}'})
+        else:
+            # The same person may appear twice in a frame; the first face wins
+            existing_logs[employee.user_id] = AttendanceLog(checkin_time=current_datetime)
+            to_checkin.append((result, employee))
+        results.append(result)
+
+    if to_checkin:
+        with timer.stage('db_write'), transaction.atomic():
+            checkins = AttendanceLog.create_checkins(
+                [employee.user for _, employee in to_checkin], current_datetime, attendance_settings,
+            )
+            # Also create legacy Attendance records for backward compatibility
+            record_legacy_attendance([
+                (employee, attendance_log)
+                for (_, employee), (attendance_log, created) in zip(to_checkin, checkins)
+                if created
+            ])
+
+        for (result, employee), (attendance_log, created) in zip(to_checkin, checkins):
+            if not created:
+                # Checked in earlier by another worker, or before our in-memory record was last emptied
+                result.update({
+                    'status': 'error',
+                    'message': f'{employee.name} already marked today',
+                    'alreadyMarked': True,
+                    'markedAt': attendance_log.checkin_time.isoformat(),
+                })
+                continue
+            status_msg = 'late' if attendance_log.status == AttendanceLog.STATUS_LATE else 'on time'
+            result.update({
+                'status': 'success',
+                'message': f'Attendance marked for {employee.name} ({status_msg})',
+                'timestamp': current_datetime.isoformat(),
+            })
+
+    return results
+
+
+@timed_stages('mark_attendance')
 def mark_attendance(request):
     """
     Accepts POST with 'image' (dataURL). Returns JSON:
@@ -57,57 +246,47 @@ def mark_attendance(request):
     """
     if request.method == 'POST':
         try:
+            timer = request.stage_timer
             img_data = request.POST.get('image')
             if not img_data:
                 return JsonResponse({'status': 'error', 'message': 'No image provided'}, status=400)
 
             # dataURL is like "data:image/jpeg;base64,/9j/4AAQ..."
-            if ',' in img_data:
-                img_bytes = base64.b64decode(img_data.split(',')[1])
-            else:
-                img_bytes = base64.b64decode(img_data)
-
-            nparr = np.frombuffer(img_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            if img is None:
-                return JsonResponse({'status': 'error', 'message': 'Unable to decode image'}, status=400)
-
-            # Convert to RGB for face_recognition
-            rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            with timer.stage('read'):
+                if ',' in img_data:
+                    img_bytes = base64.b64decode(img_data.split(',')[1])
+                else:
+                    img_bytes = base64.b64decode(img_data)
 
-            # Get face encodings from the image
-            unknown_encodings = face_recognition.face_encodings(rgb_img)
+            # Decode, detect and encode in the recognition pool (see core.recognition / core.executor)
+            try:
+                unknown_encodings = encode_probe_frame(img_bytes, timer)
+            except RecognitionUnavailable as e:
+                return JsonResponse({'status': 'error', 'message': f'{e}. Please retry.'}, status=503)
+            if unknown_encodings is None:
+                return JsonResponse({'status': 'error', 'message': 'Unable to decode image'}, status=400)
 
             if len(unknown_encodings) == 0:
                 return JsonResponse({'status': 'error', 'message': 'No face detected'})
 
-            unknown_encoding = unknown_encodings[0]
-
-            # Load all active employees with encodings and find best match by euclidean distance
-            employees = Employee.objects.exclude(face_encoding='').select_related('user').filter(user__is_active=True)
-            best_match = None
-            best_distance = 1.0
-
-            for emp in employees:
-                try:
-                    emp_encoding = np.frombuffer(base64.b64decode(emp.face_encoding), dtype=np.float64)
-                except Exception:
-                    # skip malformed encodings
-                    continue
-
-                # Skip inactive users; continue searching for another matching, active employee
-                if not emp.user.is_active:
-                    continue
+            # Strict threshold — tune between ~0.45-0.6 depending on your dataset
+            THRESHOLD = 0.48
 
-                # face_distance returns array, get single value
-                distance = face_recognition.face_distance([emp_encoding], unknown_encoding)[0]
+            # Group mode: check in every face in the frame
+            if request.POST.get('group') in ('1', 'true', 'True'):
+                results = group_checkin(unknown_encodings, THRESHOLD, timer)
+                marked = sum(1 for r in results if r['status'] == 'success')
+                return JsonResponse({
+                    'status': 'success' if marked else 'error',
+                    'message': f'Attendance marked for {marked} of {len(results)} faces',
+                    'results': results,
+                })
 
-                if distance < best_distance:
-                    best_distance = distance
-                    best_match = emp
+            unknown_encoding = unknown_encodings[0]
 
-            # Strict threshold — tune between ~0.45-0.6 depending on your dataset
-            THRESHOLD = 0.48
+            # Find best match by euclidean distance against the in-memory gallery of active employees
+            with timer.stage('match'):
+                best_match, best_distance = find_best_match(unknown_encoding, THRESHOLD)
 
             if best_match and best_distance < THRESHOLD:
                 # Check shift time
@@ -131,22 +310,20 @@ def mark_attendance(request):
                     })
                 
                 # Within shift hours - check if already marked today
-                already_log = AttendanceLog.objects.filter(
-                    employee=best_match.user,
-                    checkin_time__date=today
-                ).first()
+                with timer.stage('checkin_lookup'):
+                    already_log = todays_checkins.get(best_match.user_id)
+
+                if not already_log:
+                    with timer.stage('db_write'):
+                        # Create AttendanceLog entry unless one exists (automatically determines late/present status)
+                        attendance_log, created = AttendanceLog.create_checkin(best_match.user, current_datetime, settings)
+
+                        if created:
+                            # Also create legacy Attendance record for backward compatibility
+                            record_legacy_attendance([(best_match, attendance_log)])
+                    already_log = None if created else attendance_log
 
                 if not already_log:
-                    # Create AttendanceLog entry (automatically determines late/present status)
-                    attendance_log = AttendanceLog.create_checkin(best_match.user, current_datetime)
-                    
-                    # Also create legacy Attendance record for backward compatibility
-                    Attendance.objects.create(
-                        employee=best_match, 
-                        timestamp=current_datetime,
-                        attendance_log=attendance_log
-                    )
-                    
                     status_msg = 'late' if attendance_log.status == AttendanceLog.STATUS_LATE else 'on time'
                     return JsonResponse({
                         'status': 'success', 
@@ -225,6 +402,8 @@ class EmployeeListCreateView(APIView):
             try:
                 employee = serializer.save()
                 employee_data = EmployeeSerializer(employee, context={'request': request}).data
+                job = employee.enrollment_jobs.last()
+                employee_data['enrollmentJobId'] = str(job.id) if job else None
                 
                 return Response({
                     'success': True,
@@ -317,11 +496,13 @@ class EmployeeFaceUploadView(APIView):
 
     def post(self, request):
         """Upload an image for a given employee email and store face encoding.
-        Expected form fields: email (employee email), image (file)
-        Returns: { success, message, data: { userId, name, email, hasEncoding } }
+        Expected form fields: email (employee email), image (file),
+        optional addTemplate=true to keep the current encoding and add the photo as an extra template
+        Returns: { success, message, data: { userId, name, email, hasEncoding, templateCount } }
         """
         email = request.data.get('email')
         image_file = request.data.get('image')
+        add_template = request.data.get('addTemplate') in ('1', 'true', 'True')
 
         if not email or not image_file:
             return Response({
@@ -342,36 +523,105 @@ class EmployeeFaceUploadView(APIView):
 
         # Get or create Employee record for this user
         employee, created = Employee.objects.get_or_create(user=user_obj)
-       
-        # Read image into numpy
+
+        if settings.ENROLLMENT_ASYNC:
+            # Encoding is computed by the enrollment worker; clients poll the job status endpoint
+            job = EnrollmentJob.enqueue(employee, image_file, add_template=add_template)
+            return Response({
+                'success': True,
+                'message': 'Face enrollment queued.',
+                'data': {
+                    'userId': str(employee.user.id),
+                    'name': employee.name,
+                    'email': employee.user.email,
+                    'hasEncoding': employee.has_encoding,
+                    'jobId': str(job.id),
+                    'jobStatus': job.status,
+                }
+            }, status=status.HTTP_202_ACCEPTED)
+
+        # Decode image and compute face encoding in the recognition pool
         try:
             img_bytes = image_file.read()
-            nparr = np.frombuffer(img_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            if img is None:
-                return Response({'success': False, 'message': 'Unable to decode image'}, status=status.HTTP_400_BAD_REQUEST)
-            rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            encodings = get_or_compute(img_bytes, lambda data: run_recognition('encode_image', data))
+        except RecognitionUnavailable as e:
+            return Response({'success': False, 'message': f'{e}. Please retry.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             return Response({'success': False, 'message': f'Image processing error: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        if encodings is None:
+            return Response({'success': False, 'message': 'Unable to decode image'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Compute face encoding
-        encodings = face_recognition.face_encodings(rgb_img)
         if not encodings:
             return Response({'success': False, 'message': 'Recapture your image. No face detected in the image.'}, status=status.HTTP_400_BAD_REQUEST)
 
         encoding = encodings[0]
-        employee.face_encoding = base64.b64encode(encoding.tobytes()).decode('utf-8')
-        employee.image = image_file
-        employee.save()
+        if add_template:
+            FaceTemplate.add(employee, encoding, image=image_file)
+            message = 'Face template added.'
+        else:
+            employee.set_encoding(encoding)
+            employee.image = image_file
+            employee.save()
+            message = 'Face encoding stored successfully.'
 
         return Response({
             'success': True,
-            'message': 'Face encoding stored successfully.',
+            'message': message,
             'data': {
                 'userId': str(employee.user.id),
                 'name': employee.name,
                 'email': employee.user.email,
-                'hasEncoding': bool(employee.face_encoding),
+                'hasEncoding': employee.has_encoding,
+                'templateCount': employee.face_templates.count(),
+            }
+        }, status=status.HTTP_200_OK)
+
+
+class EnrollmentJobStatusView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, pk):
+        """Poll an enrollment job created by EmployeeFaceUploadView / employee creation.
+        Returns: { success, data: { jobId, status, message, userId, hasEncoding, createdAt, finishedAt } }
+        """
+        job = EnrollmentJob.objects.select_related('employee__user').filter(pk=pk).first()
+        if not job:
+            return Response({
+                'success': False,
+                'message': 'Enrollment job not found.'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'success': True,
+            'data': {
+                'jobId': str(job.id),
+                'status': job.status,
+                'message': job.message,
+                'userId': str(job.employee.user.id),
+                'hasEncoding': job.employee.has_encoding,
+                'createdAt': job.created_at.isoformat(),
+                'finishedAt': job.finished_at.isoformat() if job.finished_at else None,
+            }
+        }, status=status.HTTP_200_OK)
+
+
+class RecognitionStatsView(APIView):
+    permission_classes = [IsAdminOrSuperUser]
+
+    def get(self, request):
+        """Recognition cache counters for this worker process, and the enrollment queue backlog."""
+        pending = EnrollmentJob.objects.filter(status=EnrollmentJob.STATUS_PENDING)
+        oldest = pending.order_by('created_at').values_list('created_at', flat=True).first()
+        return Response({
+            'success': True,
+            'data': {
+                'probeCache': probe_cache.stats(),
+                'frameDedup': frame_dedup.stats(),
+                # A growing backlog with an old head means no enrollment worker is running
+                'enrollmentQueue': {
+                    'pending': pending.count(),
+                    'oldestPendingSeconds': round((timezone.now() - oldest).total_seconds(), 1) if oldest else None,
+                },
             }
         }, status=status.HTTP_200_OK)
 
@@ -422,7 +672,7 @@ class EmployeeCheckView(APIView):
                 'userId': str(employee.user.id),
                 'name': employee.name,
                 'email': employee.user.email,
-                'hasEncoding': bool(employee.face_encoding),
+                'hasEncoding': employee.has_encoding,
             },
             'message': 'Employee found.'
         }, status=status.HTTP_200_OK)
@@ -487,10 +737,12 @@ class EmployeeAttendanceHistoryView(APIView):
                 'message': 'You are not verified. Please do face verification first for logs.'
             }, status=status.HTTP_200_OK)
 
-        # Get attendance records (legacy Attendance model)
-        attendance_records = Attendance.objects.filter(
-            employee=employee
-        ).order_by('-timestamp')
+        # Get attendance records (AttendanceLog; legacy Attendance rows were backfilled into it).
+        # "id" stays the legacy Attendance id clients already know; check-ins without one have id None.
+        legacy_ids = Attendance.objects.filter(attendance_log=OuterRef('pk')).order_by('id').values('id')[:1]
+        attendance_records = AttendanceLog.objects.filter(
+            employee=user_obj
+        ).annotate(legacy_id=Subquery(legacy_ids)).order_by('-checkin_time', '-id')
 
         # Paginate results
         paginator = self.pagination_class()
@@ -500,14 +752,15 @@ class EmployeeAttendanceHistoryView(APIView):
         data = []
         for record in paginated_records:
             data.append({
-                'id': record.id,
+                'id': record.legacy_id,
+                'attendanceLogId': record.id,
                 'employeeId': str(employee.user.id),
                 'employeeName': employee.name,
                 'employeeEmail': employee.user.email,
-                'timestamp': record.timestamp.isoformat(),
-                'date': record.timestamp.date().isoformat(),
-                'time': record.timestamp.time().isoformat(),
-                'status': record.attendance_log.status if record.attendance_log else 'unknown',
+                'timestamp': record.checkin_time.isoformat(),
+                'date': record.checkin_time.date().isoformat(),
+                'time': record.checkin_time.time().isoformat(),
+                'status': record.status,
             })
 
         return paginator.get_paginated_response({
@@ -520,148 +773,284 @@ class EmployeeAttendanceHistoryView(APIView):
 
 class FaceRecognitionAttendanceView(APIView):
     permission_classes = [AllowAny]
+    parser_classes = [JSONParser, MultiPartParser, FormParser, RawImageParser, OctetStreamParser]
+
+    def get_image_bytes(self, request):
+        """Image bytes from a raw image body, a multipart "image" file part or a base64 "image" field."""
+        if isinstance(request.data, bytes):
+            return request.data
+
+        image_file = request.FILES.get('image')
+        if image_file:
+            return image_file.read()
+
+        img_data = request.data.get('image')
+        if not img_data:
+            return None
+
+        # dataURL is like "data:image/jpeg;base64,/9j/4AAQ..."
+        return decode_data_url(img_data)
+
+    def get_face_chips(self, request):
+        """Pre-cropped faces as [(img_bytes, box or None)], or None when the request carries a full frame.
+
+        JSON: "faces": [{"image": "<base64>", "box": [top, right, bottom, left]}, ...]
+        multipart: repeated "faces" file parts plus an optional "boxes" JSON list in the same order.
+        Raises ValueError for malformed input.
+        """
+        if isinstance(request.data, bytes):
+            return None
 
+        files = request.FILES.getlist('faces')
+        if files:
+            boxes = request.data.get('boxes')
+            boxes = json.loads(boxes) if boxes else [None] * len(files)
+            if not isinstance(boxes, list) or len(boxes) != len(files):
+                raise ValueError('"boxes" must be a list with one entry per face')
+            chips = [(face_file.read(), box) for face_file, box in zip(files, boxes)]
+        else:
+            faces = request.data.get('faces')
+            if not faces:
+                return None
+            if not isinstance(faces, list) or not all(isinstance(face, dict) and face.get('image') for face in faces):
+                raise ValueError('"faces" must be a list of {"image", "box"} objects')
+            chips = [(decode_data_url(face['image']), face.get('box')) for face in faces]
+
+        if len(chips) > settings.FACE_CHIPS_MAX:
+            raise ValueError(f'At most {settings.FACE_CHIPS_MAX} faces per request')
+        for _, box in chips:
+            if box is not None and not (
+                isinstance(box, list) and len(box) == 4 and all(isinstance(v, int) for v in box)
+                and box[0] < box[2] and box[3] < box[1]
+            ):
+                raise ValueError('"box" must be [top, right, bottom, left] in pixels')
+        return [(img_bytes, tuple(box) if box else None) for img_bytes, box in chips]
+
+    def get_option(self, request, name):
+        """Request option from the query string (raw bodies) or the JSON/form body."""
+        value = request.query_params.get(name)
+        if value is None and not isinstance(request.data, bytes):
+            value = request.data.get(name)
+        return value
+
+    def get_device_id(self, request):
+        """Kiosk identifier from the X-Device-Id header or the "device" option."""
+        return request.headers.get('X-Device-Id') or self.get_option(request, 'device')
+
+    def get_scope(self, request, timer):
+        """Location scope of the sending kiosk (see core.locations), or None for the whole gallery."""
+        with timer.stage('device'):
+            return device_scopes.get(self.get_device_id(request))
+
+    @method_decorator(timed_stages('face_recognition_attendance'))
     def post(self, request):
         """Mark attendance using face recognition.
-        Request body: { "image": "data:image/jpeg;base64,..." }
+        Request body, one of:
+          - JSON { "image": "data:image/jpeg;base64,..." }
+          - multipart/form-data with an "image" file part
+          - the raw JPEG/PNG bytes (Content-Type image/jpeg, image/png or application/octet-stream)
+          - face chips already cropped on the device (see get_face_chips); detection is skipped
+        Options such as "group" and "device" go in the JSON/form body or, for raw bodies, the query string.
         Returns: { status: 'success'|'error', message: '...', data: {...} }
         """
+        timer = request.stage_timer
         try:
-            img_data = request.data.get('image')
-            if not img_data:
+            with timer.stage('read'):
+                try:
+                    chips = self.get_face_chips(request)
+                except ValueError as e:
+                    return Response({
+                        'status': 'error',
+                        'message': f'Invalid face chips: {e}'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                img_bytes = self.get_image_bytes(request) if chips is None else None
+            if chips:
+                return self.recognize_chips(chips, self.get_scope(request, timer), timer)
+            if not img_bytes:
                 return Response({
                     'status': 'error',
                     'message': 'No image provided'
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # dataURL is like "data:image/jpeg;base64,/9j/4AAQ..."
-            if ',' in img_data:
-                img_bytes = base64.b64decode(img_data.split(',')[1])
-            else:
-                img_bytes = base64.b64decode(img_data)
-
-            nparr = np.frombuffer(img_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            if img is None:
-                return Response({
-                    'status': 'error',
-                    'message': 'Unable to decode image'
-                }, status=status.HTTP_400_BAD_REQUEST)
+            group = self.get_option(request, 'group') in (True, 'true', 'True', '1', 1)
+            return self.recognize_device_frame(img_bytes, group, self.get_device_id(request), timer)
 
-            # Convert to RGB for face_recognition
-            rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        except Exception as e:
+            # Return error message (useful for debugging)
+            return Response({
+                'status': 'error',
+                'message': f'Server error: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            # Get face encodings from the image
-            unknown_encodings = face_recognition.face_encodings(rgb_img)
+    def recognize_chips(self, chips, scope, timer):
+        """Encode and match pre-cropped faces; several chips are checked in like group mode."""
+        try:
+            unknown_encodings = run_timed_task('encode_chips_timed', chips, timer)
+        except RecognitionUnavailable as e:
+            return Response({
+                'status': 'error',
+                'message': f'{e}. Please retry.'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        undecodable = [i for i, encoding in enumerate(unknown_encodings) if encoding is None]
+        if undecodable:
+            return Response({
+                'status': 'error',
+                'message': f'Unable to decode face chip(s) {", ".join(map(str, undecodable))}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return self.match_faces(unknown_encodings, len(chips) > 1, scope, timer)
 
-            if len(unknown_encodings) == 0:
+    def recognize_device_frame(self, img_bytes, group, device_id, timer):
+        """Run detection, encoding, matching and check-in for one frame sent by device_id; returns the Response.
+
+        Also used by the kiosk WebSocket (core.consumers).
+        """
+        # Near-identical consecutive frames from the same kiosk reuse its previous face encodings;
+        # matching and the attendance decision still run for every frame
+        with timer.stage('dedup'):
+            fingerprint = frame_hash(img_bytes) if device_id else None
+            unknown_encodings = frame_dedup.get(device_id, fingerprint) if fingerprint is not None else None
+
+        if unknown_encodings is None:
+            # Decode, detect and encode in the recognition pool (see core.recognition / core.executor)
+            try:
+                unknown_encodings = encode_probe_frame(img_bytes, timer)
+            except RecognitionUnavailable as e:
                 return Response({
                     'status': 'error',
-                    'message': 'No face detected'
-                }, status=status.HTTP_200_OK)
-
-            unknown_encoding = unknown_encodings[0]
-
-            # Load only active employees with encodings and find best match by euclidean distance
-            employees = Employee.objects.exclude(face_encoding='').select_related('user').filter(user__is_active=True)
-            best_match = None
-            best_distance = 1.0
-
-            for emp in employees:
-                try:
-                    emp_encoding = np.frombuffer(base64.b64decode(emp.face_encoding), dtype=np.float64)
-                except Exception:
-                    # skip malformed encodings
-                    continue
-
-                # Defensive: ensure user is active (permission-based status)
-                if not emp.user.is_active:
-                    continue
-
-                # face_distance returns array, get single value
-                distance = face_recognition.face_distance([emp_encoding], unknown_encoding)[0]
+                    'message': f'{e}. Please retry.'
+                }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            if unknown_encodings is None:
+                return Response({
+                    'status': 'error',
+                    'message': 'Unable to decode image'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            if fingerprint is not None:
+                frame_dedup.put(device_id, fingerprint, unknown_encodings)
 
-                if distance < best_distance:
-                    best_distance = distance
-                    best_match = emp
+        with timer.stage('device'):
+            scope = device_scopes.get(device_id)
 
-            # Strict threshold — tune between ~0.45-0.6 depending on your dataset
-            THRESHOLD = 0.48
+        if len(unknown_encodings) == 0:
+            return Response({
+                'status': 'error',
+                'message': 'No face detected'
+            }, status=status.HTTP_200_OK)
 
-            if best_match and best_distance < THRESHOLD:
-                settings = AttendanceSettings.get_solo()
-                current_datetime = timezone.now()
-                local_datetime = timezone.localtime(current_datetime)
-                today = local_datetime.date()
-
-                # Build aware datetimes for start/end comparisons
-                start_dt = timezone.make_aware(datetime.combine(today, settings.start_time), timezone.get_current_timezone())
-                end_dt = timezone.make_aware(datetime.combine(today, settings.end_time), timezone.get_current_timezone())
-
-                # Enforce one attendance per day (by employee + date)
-                existing_log = AttendanceLog.objects.filter(
-                    employee=best_match.user,
-                    checkin_time__date=today
-                ).order_by('-checkin_time').first()
-                if existing_log:
-                    return Response({
-                        'status': 'error',
-                        'message': f'{best_match.name} already marked today',
-                        'data': {
-                            'employeeId': str(best_match.user.id),
-                            'employeeName': best_match.name,
-                            'employeeEmail': best_match.user.email,
-                            'alreadyMarked': True,
-                            'markedAt': existing_log.checkin_time.isoformat(),
-                            'status': existing_log.status
-                        }
-                    }, status=status.HTTP_200_OK)
-
-                # Guard rails: do not mark before start or after end
-                if local_datetime < start_dt:
-                    return Response({
-                        'status': 'error',
-                        'message': f'Too early! Shift starts at {settings.start_time.strftime("%I:%M %p")}'
-                    }, status=status.HTTP_200_OK)
+        return self.match_faces(unknown_encodings, group, scope, timer)
 
-                if local_datetime > end_dt:
-                    return Response({
-                        'status': 'error',
-                        'message': f'You are late! Shift ended at {settings.end_time.strftime("%I:%M %p")}'
-                    }, status=status.HTTP_200_OK)
+    def match_faces(self, unknown_encodings, group, scope, timer):
+        """Match encoded faces and check them in: every face in group mode, else the first one."""
+        # Strict threshold — tune between ~0.45-0.6 depending on your dataset
+        THRESHOLD = 0.48
 
-                # Create AttendanceLog entry (buffer-based late/present handled inside create_checkin)
-                attendance_log = AttendanceLog.create_checkin(best_match.user, current_datetime)
+        # Group mode: check in every face in the frame, one result per face
+        if group:
+            results = group_checkin(unknown_encodings, THRESHOLD, timer, scope)
+            marked = sum(1 for r in results if r['status'] == 'success')
+            return Response({
+                'status': 'success' if marked else 'error',
+                'message': f'Attendance marked for {marked} of {len(results)} faces',
+                'data': {
+                    'results': results
+                }
+            }, status=status.HTTP_200_OK)
 
-                # Also create legacy Attendance record for backward compatibility
-                Attendance.objects.create(
-                    employee=best_match,
-                    timestamp=current_datetime,
-                    attendance_log=attendance_log
-                )
+        unknown_encoding = unknown_encodings[0]
+
+        # Repeated frames of the same person within a few seconds reuse the previous match
+        with timer.stage('probe_cache'):
+            cached = probe_cache.get(unknown_encoding, scope)
+        best_match = None
+        if cached is not None:
+            employee_id, best_distance = cached
+            with timer.stage('match'):
+                if best_distance >= THRESHOLD:
+                    # The bound proves nothing: measure the probe against that employee's own rows
+                    best_distance = get_gallery().employee_distance(employee_id, unknown_encoding)
+                if best_distance is not None and best_distance < THRESHOLD:
+                    best_match = active_employee(employee_id)
+        if best_match is None:
+            # Find best match by euclidean distance against the in-memory gallery of active employees
+            with timer.stage('match'):
+                best_match, best_distance = find_best_match(unknown_encoding, THRESHOLD, scope)
+            if best_match is not None:
+                # Only the match is cached; the attendance decision below is made for every frame
+                probe_cache.put(unknown_encoding, (best_match.pk, best_distance), scope)
+
+        return self.checkin(best_match, best_distance, THRESHOLD, timer)
+
+    def checkin(self, best_match, best_distance, threshold, timer):
+        """Check in the matched employee (or report no match); returns the Response."""
+        if best_match and best_distance < threshold:
+            settings = AttendanceSettings.get_solo()
+            current_datetime = timezone.now()
+            local_datetime = timezone.localtime(current_datetime)
+            today = local_datetime.date()
+
+            # Build aware datetimes for start/end comparisons
+            start_dt = timezone.make_aware(datetime.combine(today, settings.start_time), timezone.get_current_timezone())
+            end_dt = timezone.make_aware(datetime.combine(today, settings.end_time), timezone.get_current_timezone())
+
+            # Enforce one attendance per day (by employee + date). Memory answers repeat frames; a check-in
+            # made elsewhere is caught by the insert below, or looked up when the guards stop the insert.
+            outside_shift = local_datetime < start_dt or local_datetime > end_dt
+            with timer.stage('checkin_lookup'):
+                existing_log = todays_checkins.get(best_match.user_id, check_db=outside_shift)
+            if existing_log:
+                return self.already_marked(best_match, existing_log)
+
+            # Guard rails: do not mark before start or after end
+            if local_datetime < start_dt:
+                return Response({
+                    'status': 'error',
+                    'message': f'Too early! Shift starts at {settings.start_time.strftime("%I:%M %p")}'
+                }, status=status.HTTP_200_OK)
 
-                status_msg = 'late' if attendance_log.status == AttendanceLog.STATUS_LATE else 'on time'
+            if local_datetime > end_dt:
                 return Response({
-                    'status': 'success',
-                    'message': f'Attendance marked for {best_match.name} ({status_msg})',
-                    'data': {
-                        'employeeId': str(best_match.user.id),
-                        'employeeName': best_match.name,
-                        'employeeEmail': best_match.user.email,
-                        'status': status_msg,
-                        'timestamp': current_datetime.isoformat()
-                    }
+                    'status': 'error',
+                    'message': f'You are late! Shift ended at {settings.end_time.strftime("%I:%M %p")}'
                 }, status=status.HTTP_200_OK)
 
-            # No suitable match found
+            with timer.stage('db_write'):
+                # Insert the AttendanceLog unless a concurrent request just did (late/present handled inside create_checkin)
+                attendance_log, created = AttendanceLog.create_checkin(best_match.user, current_datetime, settings)
+
+                if created:
+                    # Also create legacy Attendance record for backward compatibility
+                    record_legacy_attendance([(best_match, attendance_log)])
+            if not created:
+                return self.already_marked(best_match, attendance_log)
+
+            status_msg = 'late' if attendance_log.status == AttendanceLog.STATUS_LATE else 'on time'
             return Response({
-                'status': 'error',
-                'message': 'No user found with this face'
+                'status': 'success',
+                'message': f'Attendance marked for {best_match.name} ({status_msg})',
+                'data': {
+                    'employeeId': str(best_match.user.id),
+                    'employeeName': best_match.name,
+                    'employeeEmail': best_match.user.email,
+                    'status': status_msg,
+                    'timestamp': current_datetime.isoformat()
+                }
             }, status=status.HTTP_200_OK)
 
-        except Exception as e:
-            # Return error message (useful for debugging)
-            return Response({
-                'status': 'error',
-                'message': f'Server error: {str(e)}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        # No suitable match found
+        return Response({
+            'status': 'error',
+            'message': 'No user found with this face'
+        }, status=status.HTTP_200_OK)
+
+    def already_marked(self, employee, attendance_log):
+        return Response({
+            'status': 'error',
+            'message': f'{employee.name} already marked today',
+            'data': {
+                'employeeId': str(employee.user.id),
+                'employeeName': employee.name,
+                'employeeEmail': employee.user.email,
+                'alreadyMarked': True,
+                'markedAt': attendance_log.checkin_time.isoformat(),
+                'status': attendance_log.status
+            }
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,81 @@
+"""Warm-up of the recognition pool, driven by the gunicorn hooks in ``gunicorn.conf.py``.
+
+Only the pool processes (``core/executor.py``) run detection and encoding, so
+only they load OpenCV and the dlib models; neither the gunicorn master nor
+the kiosk path of the web workers imports them. In every web worker, ``start_worker_warmup()``
+starts the pool processes with one dummy inference each and repeats that
+``WARMUP_LEAD_MINUTES`` before ``AttendanceSettings.start_time`` every day,
+so the morning rush does not hit pages that were swapped out or pool
+processes that were recycled. Nothing is warmed with
+``RECOGNITION_POOL_WORKERS = 0``.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import wait
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on one scheduler sleep, so start_time changes are picked up
+MAX_SLEEP = 3600
+
+
+def warm_pool():
+    """Start every recognition pool process and run a dummy inference in each."""
+    workers = settings.RECOGNITION_POOL_WORKERS
+    if not workers:
+        return
+    from .executor import call_recognition, get_executor
+
+    started = time.monotonic()
+    executor = get_executor()
+    # Concurrent submissions make the executor spawn all of its processes
+    futures = [executor.submit(call_recognition, 'warm_up_models') for _ in range(workers)]
+    wait(futures, timeout=settings.RECOGNITION_TASK_TIMEOUT * 4)
+    logger.info('Recognition pool warm-up done in %.2fs', time.monotonic() - started)
+
+
+def next_rewarm(now):
+    """Next aware datetime WARMUP_LEAD_MINUTES before the shift start."""
+    from attendenceapp.models import AttendanceSettings
+
+    start_time = AttendanceSettings.get_solo().start_time
+    lead = timedelta(minutes=settings.WARMUP_LEAD_MINUTES)
+    local_now = timezone.localtime(now)
+    for day in (local_now.date(), local_now.date() + timedelta(days=1)):
+        run_at = timezone.make_aware(datetime.combine(day, start_time), timezone.get_current_timezone()) - lead
+        if run_at > now:
+            return run_at
+    return run_at + timedelta(days=1)
+
+
+def _rewarm_loop():
+    try:
+        warm_pool()
+    except Exception:
+        logger.warning('Recognition pool warm-up failed', exc_info=True)
+
+    while True:
+        try:
+            run_at = next_rewarm(timezone.now())
+            connections.close_all()
+            delay = (run_at - timezone.now()).total_seconds()
+            time.sleep(min(max(delay, 0), MAX_SLEEP))
+            if delay > MAX_SLEEP:
+                continue
+            warm_pool()
+        except Exception:
+            logger.warning('Recognition re-warm failed', exc_info=True)
+            time.sleep(60)
+
+
+def start_worker_warmup():
+    """Warm the recognition pool and schedule the daily re-warm in a background thread."""
+    if not settings.WARMUP_ENABLED or not settings.RECOGNITION_POOL_WORKERS:
+        return
+    threading.Thread(target=_rewarm_loop, name='recognition-warmup', daemon=True).start()
@@ -5,5 +5,30 @@ set -e
 python manage.py migrate --no-input
 python manage.py collectstatic --no-input
 
+# Train the approximate face index up front (no-op unless FACE_ANN_ENABLED); workers only load it
+python manage.py build_face_index
+
+# Background worker for queued face enrollments, restarted whenever it exits.
+# ENROLLMENT_ASYNC is read like settings.py's config(cast=bool): 1/y/yes/t/true/on in any case
+case "$(printf '%s' "${ENROLLMENT_ASYNC:-False}" | tr '[:upper:]' '[:lower:]')" in
+    1|y|yes|t|true|on)
+        (
+            while true; do
+                python manage.py run_enrollment_worker
+                echo "Enrollment worker exited with status $?; restarting in 5s" >&2
+                sleep 5
+            done
+        ) &
+        ;;
+esac
+
+# ASGI_SERVER=daphne serves HTTP and the kiosk WebSocket stream (ws/attendance/) from visiontrack.asgi instead
+if [ "${ASGI_SERVER:-}" = "daphne" ]; then
+    exec daphne -b 0.0.0.0 -p 8000 visiontrack.asgi:application
+fi
+
 # Start gunicorn
-exec gunicorn visiontrack.wsgi:application --bind 0.0.0.0:8000 --workers 2 --timeout 60
+# Threads let a web worker keep serving other requests while recognition runs in the pool
+# WEB_CONCURRENCY also sizes each worker's recognition pool (see RECOGNITION_POOL_WORKERS in settings)
+# gunicorn.conf.py (preload + recognition warm-up hooks) is read from the working directory
+exec gunicorn visiontrack.wsgi:application --bind 0.0.0.0:8000 --workers "${WEB_CONCURRENCY:-2}" --threads 8 --timeout 60
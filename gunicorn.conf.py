@@ -0,0 +1,19 @@
+"""Gunicorn settings (loaded automatically from the working directory).
+
+The app is imported once in the master so every forked worker shares its
+pages. The recognition stack is not part of that import: each web worker
+warms its recognition pool processes instead (see core/warmup.py).
+"""
+import gc
+
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Objects allocated so far are never collected, so the GC never writes to (and un-shares) their pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from core.warmup import start_worker_warmup
+    start_worker_warmup()
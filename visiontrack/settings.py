@@ -44,6 +44,7 @@ else:
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',  # runserver serves the ASGI application, WebSockets included
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -54,6 +55,7 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt.token_blacklist', # For token rotation
     'djoser',
     'corsheaders',
+    'channels',
     'core',
     'user'
     ,'attendenceapp'
@@ -136,6 +138,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'visiontrack.wsgi.application'
+ASGI_APPLICATION = 'visiontrack.asgi.application'
 
 
 # Database
@@ -210,4 +213,102 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+
+# Face recognition
+# Optional IVF approximate nearest-neighbour index for large galleries (see core/ann.py).
+# Candidates are always re-ranked exactly, so the match threshold keeps its meaning;
+# FACE_ANN_N_PROBE trades recall for speed. The index is trained by "manage.py build_face_index"
+# (run by entrypoint.sh); workers only load it and scan exactly when it is missing or stale.
+FACE_ANN_ENABLED = config('FACE_ANN_ENABLED', default=False, cast=bool)
+FACE_ANN_MIN_GALLERY_SIZE = config('FACE_ANN_MIN_GALLERY_SIZE', default=5000, cast=int)
+FACE_ANN_N_PROBE = config('FACE_ANN_N_PROBE', default=8, cast=int)
+FACE_ANN_INDEX_PATH = config('FACE_ANN_INDEX_PATH', default=os.path.join(BASE_DIR, 'var', 'face_ann_index.npz'))
+
+# Gallery snapshot shared by all workers through np.memmap (see core/snapshot.py).
+# Must live on a filesystem shared by every worker of this host. When disabled, each process
+# loads the gallery from the DB and reloads it when the core.GalleryVersion row changes.
+FACE_GALLERY_SNAPSHOT_ENABLED = config('FACE_GALLERY_SNAPSHOT_ENABLED', default=True, cast=bool)
+FACE_GALLERY_SNAPSHOT_PATH = config('FACE_GALLERY_SNAPSHOT_PATH', default=os.path.join(BASE_DIR, 'var', 'face_gallery.bin'))
+
+# Probe frame preprocessing (see core/recognition.py). 0 disables the step.
+FACE_PROBE_DECODE_SIDE = config('FACE_PROBE_DECODE_SIDE', default=960, cast=int)
+FACE_PROBE_DETECT_SIDE = config('FACE_PROBE_DETECT_SIDE', default=480, cast=int)
+
+# Recognition process pool (see core/executor.py). 0 workers runs recognition inline.
+# Every web worker starts its own pool, so the host runs WEB_CONCURRENCY x RECOGNITION_POOL_WORKERS
+# dlib processes; the default splits the CPUs between the web workers. WEB_CONCURRENCY is also
+# what gunicorn reads for its default --workers (entrypoint.sh passes it explicitly).
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=2, cast=int)
+RECOGNITION_POOL_WORKERS = config(
+    'RECOGNITION_POOL_WORKERS', default=max(1, (os.cpu_count() or 1) // max(1, WEB_CONCURRENCY)), cast=int
+)
+RECOGNITION_POOL_START_METHOD = config('RECOGNITION_POOL_START_METHOD', default='spawn')
+RECOGNITION_QUEUE_DEPTH = config('RECOGNITION_QUEUE_DEPTH', default=0, cast=int)  # 0 = 4 tasks per pool worker
+RECOGNITION_TASK_TIMEOUT = config('RECOGNITION_TASK_TIMEOUT', default=15, cast=float)
+
+# Face enrollment: queue encodings for the run_enrollment_worker command instead of
+# computing them inside the upload request. Uploads then answer 202 with a job id instead of
+# 200, so clients must poll the job; entrypoint.sh only starts (and restarts) the worker when on.
+ENROLLMENT_ASYNC = config('ENROLLMENT_ASYNC', default=False, cast=bool)
+ENROLLMENT_JOB_TIMEOUT = config('ENROLLMENT_JOB_TIMEOUT', default=600, cast=int)  # seconds before a running job is retried
+
+# Content-addressed cache of enrollment encodings (see core/encoding_cache.py). 0 disables it.
+ENCODING_CACHE_MAX_ENTRIES = config('ENCODING_CACHE_MAX_ENTRIES', default=10000, cast=int)
+
+# Short-TTL cache of recent probe decisions (see core/probe_cache.py). Size 0 disables it.
+PROBE_CACHE_SIZE = config('PROBE_CACHE_SIZE', default=256, cast=int)
+PROBE_CACHE_TTL = config('PROBE_CACHE_TTL', default=3.0, cast=float)  # seconds
+PROBE_CACHE_RADIUS = config('PROBE_CACHE_RADIUS', default=0.15, cast=float)  # encoding distance
+
+# Per-kiosk near-duplicate frame detection (see core/frame_dedup.py). 0 devices disables it.
+FRAME_DEDUP_MAX_DEVICES = config('FRAME_DEDUP_MAX_DEVICES', default=1024, cast=int)
+FRAME_DEDUP_TTL = config('FRAME_DEDUP_TTL', default=5.0, cast=float)  # seconds
+FRAME_DEDUP_MAX_DISTANCE = config('FRAME_DEDUP_MAX_DISTANCE', default=4, cast=int)  # differing dHash bits out of 64
+
+# Prometheus metrics endpoint (core/metrics/). When set, scrapers must send "Authorization: Bearer <token>";
+# when empty the endpoint is limited to logged-in staff users (open to everyone only with DEBUG=True).
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Extra face templates kept per employee (see core.models.FaceTemplate); the oldest are dropped beyond this.
+FACE_TEMPLATES_MAX = config('FACE_TEMPLATES_MAX', default=5, cast=int)
+
+# Recognition pool warm-up under gunicorn (see gunicorn.conf.py and core/warmup.py)
+WARMUP_ENABLED = config('WARMUP_ENABLED', default=True, cast=bool)
+WARMUP_LEAD_MINUTES = config('WARMUP_LEAD_MINUTES', default=10, cast=int)  # re-warm this long before shift start
+
+# Most pre-cropped face chips accepted in one /api/mark-attendance/ request
+FACE_CHIPS_MAX = config('FACE_CHIPS_MAX', default=16, cast=int)
+
+# int8 gallery (see core/quantize.py): candidates are re-ranked exactly against the float32 rows. The
+# ~4x memory saving per worker needs FACE_GALLERY_SNAPSHOT_ENABLED, which keeps those rows memory-mapped
+# instead of resident. Takes precedence over FACE_ANN_ENABLED.
+FACE_GALLERY_QUANTIZED = config('FACE_GALLERY_QUANTIZED', default=False, cast=bool)
+FACE_GALLERY_RERANK = config('FACE_GALLERY_RERANK', default=8, cast=int)  # minimum candidates re-ranked per probe
+
+# Seconds a kiosk's device -> location lookup is cached (see core/locations.py)
+DEVICE_SCOPE_TTL = config('DEVICE_SCOPE_TTL', default=60, cast=int)
+
+# Kiosk WebSocket stream (see core/consumers.py). The in-memory channel layer only
+# reaches sockets of the same server process; set CHANNEL_REDIS_URL (channels_redis)
+# when several ASGI processes serve the same kiosks.
+CHANNEL_REDIS_URL = config('CHANNEL_REDIS_URL', default='')
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {'hosts': [CHANNEL_REDIS_URL]},
+    } if CHANNEL_REDIS_URL else {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+WS_FRAME_MAX_AGE = config('WS_FRAME_MAX_AGE', default=1.0, cast=float)  # seconds a frame may wait before it is dropped
+WS_FRAME_MAX_BYTES = config('WS_FRAME_MAX_BYTES', default=5 * 1024 * 1024, cast=int)
+
+# Also write a legacy core.Attendance row for every check-in. AttendanceLog is the source of
+# truth; readers of the old table can use core.models.AttendanceCompat (view core_attendance_compat).
+ATTENDANCE_LEGACY_DUAL_WRITE = config('ATTENDANCE_LEGACY_DUAL_WRITE', default=True, cast=bool)
+
+# Seconds before a worker forgets the check-ins it remembers for today (see attendenceapp/checkins.py),
+# so check-ins deleted elsewhere stop answering "already marked"
+CHECKIN_CACHE_TTL = config('CHECKIN_CACHE_TTL', default=60, cast=int)